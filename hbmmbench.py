@@ -0,0 +1,226 @@
+"""Benchmarks for the mod manager engine on synthetic Blood Money game folders.
+
+Builds a fake game folder laid out the way route_file expects
+(Scenes/<Mission>/<Mission><type>.zip, Scenes/HitmanBloodMoney.zip and
+Scenes/saveandcontinue.zip) and a library of N mods x M files, then times routing,
+loading the mod library, backups, installs (one mod at a time and as one batch)
+and restores. Results are written to a JSON file; pass an earlier one with
+--compare to see what got faster or slower.
+
+    python hbmmbench.py --missions 4 --mods 20 --files-per-mod 50 --out bench.json
+"""
+import os
+import sys
+import argparse
+import configparser
+import json
+import platform
+import random
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import datetime
+
+import hbmmodcore
+from hbmmodcore import MISSIONS, SCENE_TYPES, ModEngine, list_snapshots, route_file, route_many
+
+BENCH_VERSION = 1  # Bump when the meaning of a result changes
+MB = 1024 * 1024
+
+
+def make_payload(rng, size, compressible):
+    """size bytes of either repetitive text or random bytes, like scene data and textures."""
+    if compressible:
+        line = f"prop_{rng.randrange(1000)} pos {rng.random():.4f} {rng.random():.4f}\n".encode()
+        return (line * (size // len(line) + 1))[:size]
+    return rng.randbytes(size)
+
+
+def entry_name(mission, scene_type, index, extension):
+    return f"{mission}{scene_type}_{index:04d}{extension}"
+
+
+def build_game(game_folder, missions, entries_per_archive, entry_size, rng):
+    """Create the Scenes folder. Returns (file_count, byte_count) of the archives written."""
+    extensions = (".tex", ".prm", ".buf", ".snd")
+    archives = {}
+    for mission in missions:
+        for scene_type in SCENE_TYPES:
+            zip_path = os.path.join(game_folder, "Scenes", mission, f"{mission}{scene_type}.zip")
+            archives[zip_path] = [(f"Scenes/{mission}/{entry_name(mission, scene_type, i, extensions[i % len(extensions)])}",
+                                   extensions[i % len(extensions)]) for i in range(entries_per_archive)]
+    for name in ("HitmanBloodMoney", "saveandcontinue"):
+        zip_path = os.path.join(game_folder, "Scenes", f"{name}.zip")
+        archives[zip_path] = [(f"Scenes/{name}_{i:04d}.tex", ".tex") for i in range(entries_per_archive)]
+
+    total_bytes = 0
+    for zip_path, entries in archives.items():
+        os.makedirs(os.path.dirname(zip_path), exist_ok=True)
+        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for internal_path, extension in entries:
+                zf.writestr(internal_path, make_payload(rng, entry_size, extension != ".tex"))
+        total_bytes += os.path.getsize(zip_path)
+    return len(archives), total_bytes
+
+
+def build_mods(mods_path, missions, mod_count, files_per_mod, entries_per_archive, file_size, rng):
+    """Create mod folders whose files replace entries of the generated archives.
+
+    Returns (file_count, byte_count) of the mod files written.
+    """
+    total_files = total_bytes = 0
+    extensions = (".tex", ".prm", ".buf", ".snd")
+    for mod_index in range(mod_count):
+        mission = missions[mod_index % len(missions)]
+        folder = os.path.join(mods_path, f"BenchMod{mod_index:03d}_{mission}")
+        os.makedirs(folder, exist_ok=True)
+        lines = [f"Name: Bench Mod {mod_index}", "Author: hbmmbench", "Description: Synthetic benchmark mod"]
+        for file_index in range(files_per_mod):
+            scene_type = SCENE_TYPES[rng.randrange(len(SCENE_TYPES))]
+            entry = rng.randrange(entries_per_archive)
+            name = entry_name(mission, scene_type, entry, extensions[entry % len(extensions)])
+            with open(os.path.join(folder, name), "wb") as f:
+                f.write(make_payload(rng, file_size, not name.endswith(".tex")))
+            lines.append(f"{name}: {name}")
+            total_files += 1
+            total_bytes += file_size
+        with open(os.path.join(folder, "mod.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+    return total_files, total_bytes
+
+
+def result(seconds, files=0, size=0):
+    """One timing entry, with throughput when there is something to divide."""
+    entry = {"seconds": round(seconds, 6), "files": files, "bytes": size}
+    if seconds > 0:
+        entry["files_per_s"] = round(files / seconds, 1)
+        entry["mb_per_s"] = round(size / MB / seconds, 2)
+    return entry
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    value = func(*args, **kwargs)
+    return value, time.perf_counter() - started
+
+
+def run_benchmarks(args, work_dir):
+    rng = random.Random(args.seed)
+    missions = MISSIONS[1:1 + args.missions]
+    game_folder = os.path.join(work_dir, "game")
+    mods_path = os.path.join(work_dir, "Mods")
+    backup_root = os.path.join(work_dir, "Backups")
+    catalog_path = os.path.join(work_dir, "mod_catalog.json")
+
+    print(f"Generating game folder ({len(missions)} missions) and {args.mods} mods x {args.files_per_mod} files in {work_dir}...")
+    archive_count, game_bytes = build_game(game_folder, missions, args.entries, args.entry_size * 1024, rng)
+    mod_files, mod_bytes = build_mods(mods_path, missions, args.mods, args.files_per_mod, args.entries, args.file_size * 1024, rng)
+
+    config = configparser.ConfigParser()
+    config["Settings"] = {"game_install_folder": game_folder, "backup_folder": backup_root,
+                          "install_workers": str(args.workers)}
+    engine = ModEngine(config, mods_path=mods_path, catalog_path=catalog_path)
+    results = {}
+
+    mods, seconds = timed(engine.load_mods)
+    results["load_mods_cold"] = result(seconds, len(mods))
+    _, seconds = timed(engine.load_mods)
+    results["load_mods_cached"] = result(seconds, len(mods))
+
+    names = [(os.path.basename(source), mod["folder"]) for mod in mods for source in engine.mod_sources(mod)]
+    route_file.cache_clear()
+    _, seconds = timed(lambda: [route_file(name, folder) for name, folder in names])
+    results["route_cold"] = result(seconds, len(names))
+    _, seconds = timed(lambda: [route_many([name], folder) for name, folder in names])
+    results["route_cached"] = result(seconds, len(names))
+
+    _, seconds = timed(engine.create_backup)
+    results["backup_full"] = result(seconds, archive_count, game_bytes)
+    _, seconds = timed(engine.create_backup)
+    results["backup_unchanged"] = result(seconds, archive_count, game_bytes)
+
+    started = time.perf_counter()
+    for mod in mods:
+        engine.install_mod(mod)
+    results["install"] = result(time.perf_counter() - started, mod_files, mod_bytes)
+
+    snapshot = list_snapshots(backup_root)[-1]
+    changes, seconds = timed(engine.restore_backup, snapshot, dry_run=True)
+    changed_bytes = sum(os.path.getsize(os.path.join(game_folder, rel_path)) for rel_path, _ in changes)
+    results["restore_diff"] = result(seconds, archive_count, game_bytes)
+    _, seconds = timed(engine.restore_backup, snapshot, changes=changes)
+    results["restore"] = result(seconds, len(changes), changed_bytes)
+
+    # The same library again as one batch, merged into a single rewrite per archive
+    _, seconds = timed(engine.install_mods, mods)
+    results["install_batch"] = result(seconds, mod_files, mod_bytes)
+    # Nothing changed since, so every file should be skipped and no archive rewritten
+    _, seconds = timed(engine.install_mods, mods)
+    results["install_reapply"] = result(seconds, mod_files, mod_bytes)
+
+    return {
+        "version": BENCH_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "engine": os.path.basename(hbmmodcore.__file__),
+        "params": {"missions": len(missions), "entries": args.entries, "entry_size_kb": args.entry_size,
+                   "mods": args.mods, "files_per_mod": args.files_per_mod, "file_size_kb": args.file_size,
+                   "workers": args.workers, "seed": args.seed,
+                   "game_bytes": game_bytes, "archives": archive_count, "mod_bytes": mod_bytes},
+        "results": results,
+    }
+
+
+def print_report(report, baseline=None):
+    print(f"{'operation':<18}{'seconds':>10}{'files/s':>12}{'MB/s':>10}" + ("   speedup" if baseline else ""))
+    for name, entry in report["results"].items():
+        line = f"{name:<18}{entry['seconds']:>10.3f}{entry.get('files_per_s', 0):>12.1f}{entry.get('mb_per_s', 0):>10.2f}"
+        old = (baseline or {}).get("results", {}).get(name)
+        if old and entry["seconds"] > 0:
+            line += f"   {old['seconds'] / entry['seconds']:.2f}x"
+        print(line)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the mod manager engine on synthetic game folders")
+    parser.add_argument("--missions", type=int, default=4, help=f"missions to generate (up to {len(MISSIONS) - 1})")
+    parser.add_argument("--entries", type=int, default=50, help="entries per scene archive")
+    parser.add_argument("--entry-size", type=int, default=64, help="size of each archive entry in KB")
+    parser.add_argument("--mods", type=int, default=10, help="number of mods")
+    parser.add_argument("--files-per-mod", type=int, default=20, help="files in each mod")
+    parser.add_argument("--file-size", type=int, default=64, help="size of each mod file in KB")
+    parser.add_argument("--workers", type=int, default=0, help="install_workers setting, 0 for one per CPU core")
+    parser.add_argument("--seed", type=int, default=1, help="seed for the generated data")
+    parser.add_argument("--work-dir", help="folder to generate into (default: a temporary folder that is removed afterwards)")
+    parser.add_argument("--out", default="bench_results.json", help="JSON file to write results to")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    if args.work_dir:
+        os.makedirs(args.work_dir, exist_ok=True)
+        report = run_benchmarks(args, args.work_dir)
+    else:
+        work_dir = tempfile.mkdtemp(prefix="hbmmbench_")
+        try:
+            report = run_benchmarks(args, work_dir)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("params") != report["params"]:
+            print("Warning: the baseline was run with different parameters.")
+    print_report(report, baseline)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,2349 @@
+"""Install, backup and recovery engine for the Hitman: Blood Money Mod Manager.
+
+Nothing in this module imports Tk, so it runs the same under the GUI, the command
+line and the archive worker processes.
+"""
+import os
+import sys
+import argparse
+import threading
+import logging
+import logging.handlers
+import atexit
+import configparser
+import zipfile
+import shutil
+import tempfile
+import time
+import struct
+import queue
+import json
+import hashlib
+import filecmp
+import zlib
+import re
+import functools
+import contextlib
+import copy
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+MODS_PATH = "Mods"
+CONFIG_PATH = "config.ini"
+CATALOG_PATH = "mod_catalog.json"  # Parsed mod.txt cache, lives next to config.ini
+CATALOG_VERSION = 1  # Bump when parse_mod_info's output changes shape
+WATCH_INTERVAL = 2.0  # Seconds between polls of the Mods folder
+
+# Destination routing rules, compiled once (see route_file)
+MISSIONS = ("Hideout",) + tuple(f"M{str(i).zfill(2)}" for i in range(14) if i != 7)
+SCENE_TYPES = ("_albino", "_intro", "_main", "_news", "_premission", "_postmission")
+GENERAL_TYPES = frozenset((".anm", ".buf", ".gms", ".loc", ".mat", ".oct", ".prm", ".prp", ".rmc", ".rmi", ".sgd", ".sgp", ".snd", ".sup", ".tex", ".zgf"))
+MISSION_PREFIX_RE = re.compile("^(?:" + "|".join(MISSIONS) + ")")
+ZIP_COMPONENT_RE = re.compile(r"\.zip(?=[\\/])", re.IGNORECASE)  # End of a path component named *.zip, in any case
+
+# Compression policy for entries written into scene archives (see choose_compression)
+COMPRESSION_POLICIES = ("auto", "deflate", "store")
+INCOMPRESSIBLE_EXTENSIONS = frozenset((".tex", ".snd", ".zip", ".ogg", ".wav", ".png", ".jpg"))
+COMPRESSION_SAMPLE_SIZE = 16 * 1024  # Bytes of a file test-compressed in auto mode
+COMPRESSION_MIN_SAVING = 0.10  # Auto mode stores files that deflate by less than this
+BACKUP_PATH = "Backups"
+EXECUTABLE_EXTENSIONS = (".exe", ".dll", ".bat", ".cmd", ".sh", ".scr", ".lnk", ".pif", ".cpl", ".sys", ".vbs", ".jar", ".asi")
+COPY_CHUNK_SIZE = 1024 * 1024  # Bytes moved per read when copying raw zip entries
+SWAP_SUFFIX = ".hbmm-tmp"  # Sibling file an archive is rewritten into before being swapped in
+COMPACT_THRESHOLD = 0.25  # Fraction of dead space at which an archive updated in append mode is compacted
+ARCHIVE_TAIL_SIZE = 4096  # Bytes before an append that recover_transaction checks are still the old end records
+TRANSACTIONS_DIR = "transactions"  # Write-ahead records of in-flight archive rewrites, in the backup folder
+BLOBS_DIR = "blobs"  # Content-addressed file store inside the backup folder
+SNAPSHOTS_DIR = "snapshots"  # One JSON manifest per backup inside the backup folder
+RESTORE_IO_WORKERS = 8  # Threads used to hash and copy files during a restore
+JOURNAL_FILE = "install_journal.jsonl"  # Append-only record of installed files, kept in the backup folder
+ARCHIVE_INDEX_FILE = "archive_index.json"  # Central directories of the scene archives, kept in the backup folder
+ARCHIVE_INDEX_VERSION = 1  # Bump when index_record's output changes shape
+LOG_FILE = "mod_manager_log.txt"
+LOG_MAX_BYTES = 1024 * 1024  # Size at which the log file is rotated
+LOG_BACKUP_COUNT = 3  # Rotated log files kept next to the current one
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(threadName)s] %(message)s"
+
+# Offsets into a zip local file header (see zipfile.structFileHeader)
+_FH_FILENAME_LENGTH = 10
+_FH_EXTRA_FIELD_LENGTH = 11
+_ZIP64_EXTRA_ID = 0x0001
+_DATA_DESCRIPTOR_FLAG = 0x08
+_ENCRYPTED_FLAG = 0x01
+_DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+
+
+class Tracer:
+    """Span timings for the hot paths, switched on with enabled under [Tracing] in config.ini.
+
+    While disabled, span() hands back one shared no-op context manager, so instrumented
+    code pays for a function call and nothing else. Recorded events use the Chrome
+    trace-event fields (microsecond ts and dur), see write_chrome_trace.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self._lock = threading.Lock()
+
+    def span(self, name, **args):
+        if not self.enabled:
+            return _NO_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name, start_ns, end_ns, args):
+        event = {"name": name, "ph": "X", "ts": start_ns / 1000, "dur": (end_ns - start_ns) / 1000,
+                 "pid": os.getpid(), "tid": threading.get_native_id(), "args": args}
+        with self._lock:
+            self.events.append(event)
+
+    def take(self):
+        """Remove and return everything recorded so far."""
+        with self._lock:
+            events, self.events = self.events, []
+        return events
+
+    def merge(self, events):
+        """Add events recorded in another process, e.g. an archive worker."""
+        with self._lock:
+            self.events.extend(events)
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "args", "start_ns")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.name, self.start_ns, time.perf_counter_ns(), self.args)
+
+
+_NO_SPAN = contextlib.nullcontext()
+tracer = Tracer()
+
+
+def trace_summary(events):
+    """Total seconds and count per span name, slowest first."""
+    summary = {}
+    for event in events:
+        entry = summary.setdefault(event["name"], {"count": 0, "seconds": 0.0})
+        entry["count"] += 1
+        entry["seconds"] += event["dur"] / 1e6
+    return dict(sorted(((name, {"count": entry["count"], "seconds": round(entry["seconds"], 6)})
+                        for name, entry in summary.items()), key=lambda item: -item[1]["seconds"]))
+
+
+logger = logging.getLogger("hbmm")
+_log_listener = None
+
+
+def setup_logging(config, console=False):
+    """Route the "hbmm" logger through a queue to a background thread that writes the log.
+
+    Callers only pay for putting a record on the queue; formatting and file I/O
+    happen on the listener thread. The file rotates at max_bytes. Levels come from
+    [Logging] in config.ini, so debug records are dropped before they are formatted
+    at the default INFO level. With console, warnings and up also go to stderr.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+    level = config.get("Logging", "level", fallback="INFO").upper()
+    file_handler = logging.handlers.RotatingFileHandler(
+        config.get("Logging", "file", fallback=LOG_FILE) or LOG_FILE, encoding="utf-8",
+        maxBytes=config.getint("Logging", "max_bytes", fallback=LOG_MAX_BYTES),
+        backupCount=config.getint("Logging", "backup_count", fallback=LOG_BACKUP_COUNT))
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    handlers = [file_handler]
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(config.get("Logging", "console_level", fallback="WARNING").upper())
+        console_handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+        handlers.append(console_handler)
+
+    log_queue = queue.SimpleQueue()
+    logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    logger.setLevel(level)
+    logger.propagate = False
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    return _log_listener
+
+
+@atexit.register
+def _stop_logging():
+    # Flush whatever is still queued before the interpreter exits
+    if _log_listener is not None:
+        _log_listener.stop()
+
+
+def write_chrome_trace(path, events):
+    """Write events as a Chrome trace-event file, viewable in chrome://tracing or Perfetto."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+@functools.lru_cache(maxsize=None)
+def _mission_for_folder(mod_folder):
+    """First mission whose name appears in the mod folder name, or None."""
+    folder = mod_folder.lower()
+    return next((mission for mission in MISSIONS if mission.lower() in folder), None)
+
+
+@functools.lru_cache(maxsize=65536)
+def route_file(file_name, mod_folder):
+    """Map a mod file to its path relative to the game folder.
+
+    Archive destinations look like Scenes/<Mission>/<Mission><type>.zip/Scenes/<Mission>/<file>.
+    """
+    file_lower = file_name.lower()
+    file_extension = os.path.splitext(file_lower)[1]
+
+    # Special rule for placing config files in the root directory
+    if file_extension == ".ini":
+        return file_name
+
+    # Special case for saveandcontinue.TEX
+    if file_lower == "saveandcontinue.tex":
+        return "Scenes/saveandcontinue.zip/Scenes/saveandcontinue.TEX"
+
+    # Match mission-specific files with scene types
+    match = MISSION_PREFIX_RE.match(file_name)
+    if match:
+        mission = match.group(0)
+        for scene_type in SCENE_TYPES:
+            if scene_type in file_name:
+                return f"Scenes/{mission}/{mission}{scene_type}.zip/Scenes/{mission}/{file_name}"
+
+    # General file types go into the main mission folder matching the mod folder name
+    if file_extension in GENERAL_TYPES:
+        mission = _mission_for_folder(mod_folder)
+        if mission:
+            return f"Scenes/{mission}/{mission}_main.zip/Scenes/{mission}/{file_name}"
+
+    # Special cases for HitmanBloodMoney.zip and saveandcontinue.zip (single location rules)
+    if "hitmanbloodmoney" in file_lower:
+        return f"Scenes/HitmanBloodMoney.zip/Scenes/{file_name}"
+    if "saveandcontinue" in file_lower:
+        return f"Scenes/saveandcontinue.zip/Scenes/{file_name}"
+
+    # Default case: place in the main game directory if no other rule matches
+    return file_name
+
+
+def route_many(file_names, mod_folder):
+    """Route a whole mod manifest in one call; returns destinations in the same order."""
+    return [route_file(file_name, mod_folder) for file_name in file_names]
+
+
+def split_archive_path(full_destination):
+    """Split a mapped destination into (zip_path, internal_path).
+
+    internal_path is None when the destination is a loose file outside any archive.
+    """
+    if ".zip" not in full_destination:
+        return full_destination, None
+    zip_path, internal_path = full_destination.split(".zip", 1)
+    internal_path = internal_path.replace("\\", "/").lstrip("/")
+    return zip_path + ".zip", internal_path
+
+
+def group_install_files(pending):
+    """Group (source, full_destination) pairs by the scene archive they land in.
+
+    Returns (archives, loose_files) where archives maps each zip path to an
+    {internal_path: source} dict and loose_files is a list of (source, destination).
+    Later entries for the same internal path win, matching the old install order.
+    """
+    archives = {}
+    loose_files = []
+    for source, full_destination in pending:
+        zip_path, internal_path = split_archive_path(full_destination)
+        if internal_path is None:
+            loose_files.append((source, full_destination))
+        else:
+            archives.setdefault(zip_path, {})[internal_path] = source
+    return archives, loose_files
+
+
+def mod_targets(mod):
+    """Route every file of a parsed mod to an (archive, entry) target.
+
+    archive is relative to the game folder, or None for loose files (entry is then
+    the path relative to the game folder). Returns {target: source} in manifest order.
+    """
+    sources = [file_info["source"] for file_info in mod["files"]]
+    targets = {}
+    for source, destination in zip(sources, route_many([os.path.basename(source) for source in sources], mod["folder"])):
+        archive, entry = split_archive_path(destination)
+        targets[(archive, entry) if entry is not None else (None, archive)] = source
+    return targets
+
+
+class ConflictIndex:
+    """Index of which mods write each (archive, entry) target.
+
+    Built once from the mod catalog and kept current with add_mod/remove_mod, so
+    conflict checks never re-route files.
+    """
+
+    def __init__(self, mods=()):
+        self.writers = {}  # target -> {mod_folder: source}
+        self.targets = {}  # mod_folder -> set of targets
+        for mod in mods:
+            self.add_mod(mod)
+
+    def add_mod(self, mod):
+        self.remove_mod(mod["folder"])
+        targets = mod_targets(mod)
+        self.targets[mod["folder"]] = set(targets)
+        for target, source in targets.items():
+            self.writers.setdefault(target, {})[mod["folder"]] = source
+
+    def remove_mod(self, folder):
+        for target in self.targets.pop(folder, ()):
+            writers = self.writers[target]
+            del writers[folder]
+            if not writers:
+                del self.writers[target]
+
+    def conflicts(self, folders):
+        """Return {target: [mod_folder, ...]} for targets written by more than one of folders."""
+        selected = set(folders)
+        result = {}
+        for folder in folders:
+            for target in self.targets.get(folder, ()):
+                if target in result:
+                    continue
+                writers = [writer for writer in self.writers[target] if writer in selected]
+                if len(writers) > 1:
+                    result[target] = writers
+        return result
+
+    def conflict_matrix(self):
+        """Return {mod_folder: {other_folder: shared_target_count}} across the whole library."""
+        matrix = {}
+        for writers in self.writers.values():
+            if len(writers) < 2:
+                continue
+            for folder in writers:
+                row = matrix.setdefault(folder, {})
+                for other in writers:
+                    if other != folder:
+                        row[other] = row.get(other, 0) + 1
+        return matrix
+
+
+def _strip_zip64_extra(extra):
+    """Drop ZIP64 records from an extra field; they are regenerated on write."""
+    kept = b""
+    i = 0
+    while i + 4 <= len(extra):
+        header_id, size = struct.unpack("<HH", extra[i:i + 4])
+        if header_id != _ZIP64_EXTRA_ID:
+            kept += extra[i:i + 4 + size]
+        i += 4 + size
+    return kept
+
+
+def split_source(source):
+    """Split a mod file path into (mod_zip, entry) if it points inside a mod .zip, else (source, None).
+
+    The mod archive is the first path component named *.zip that is a file; like the
+    mods folder scan, the extension may be in any case, and the path keeps its spelling.
+    """
+    for match in ZIP_COMPONENT_RE.finditer(source):
+        zip_path = source[:match.end()]
+        if os.path.isfile(zip_path):
+            return zip_path, source[match.end():].replace("\\", "/").lstrip("/")
+    return source, None
+
+
+class SourceReader:
+    """Reads mod files, whether they sit in an extracted mod folder or inside a mod .zip.
+
+    Sources stay plain path strings, so they can go into the journal and to worker
+    processes. A file inside a mod archive is the .zip's path followed by the entry,
+    e.g. Mods/SomeMod.zip/SomeMod/M05_main_0001.tex (see split_source), and is read
+    straight from the archive without extracting it. Each mod archive is opened once
+    and kept open until close(), so its central directory is parsed once however
+    many files come out of it. Not thread-safe; use one reader per thread.
+    """
+
+    def __init__(self):
+        self.archives = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for zf in self.archives.values():
+            zf.close()
+        self.archives.clear()
+
+    def archive(self, zip_path):
+        zf = self.archives.get(zip_path)
+        if zf is None:
+            zf = self.archives[zip_path] = zipfile.ZipFile(zip_path, "r")
+        return zf
+
+    def info(self, source):
+        """The ZipInfo of a source inside a mod archive, or None for a file on disk."""
+        zip_path, internal_path = split_source(source)
+        if internal_path is None:
+            return None
+        return self.archive(zip_path).getinfo(internal_path)
+
+    def open(self, source):
+        zip_path, internal_path = split_source(source)
+        if internal_path is None:
+            return open(source, "rb")
+        return self.archive(zip_path).open(internal_path)
+
+    def size(self, source):
+        info = self.info(source)
+        return info.file_size if info else os.path.getsize(source)
+
+    def crc32(self, source):
+        """CRC-32 of a source. Free for archive entries, whose central directory has it."""
+        info = self.info(source)
+        return info.CRC if info else file_crc32(source)
+
+
+def choose_compression(source, policy="auto", reader=None):
+    """Pick ZIP_STORED or ZIP_DEFLATED for a file being written into an archive.
+
+    "auto" stores known already-compressed types outright, and otherwise deflates a
+    sample from the start of the file to see whether compression is worth the CPU.
+    A source that is already deflated in its mod archive is judged by its own ratio.
+    """
+    if policy == "store":
+        return zipfile.ZIP_STORED
+    if policy == "deflate":
+        return zipfile.ZIP_DEFLATED
+    if os.path.splitext(source)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    info = reader.info(source) if reader else None
+    if info is not None and info.compress_type == zipfile.ZIP_DEFLATED and info.file_size:
+        saving = 1 - info.compress_size / info.file_size
+        return zipfile.ZIP_DEFLATED if saving >= COMPRESSION_MIN_SAVING else zipfile.ZIP_STORED
+    with (reader.open(source) if reader else open(source, "rb")) as f:
+        sample = f.read(COMPRESSION_SAMPLE_SIZE)
+    if not sample:
+        return zipfile.ZIP_STORED
+    saving = 1 - len(zlib.compress(sample, 1)) / len(sample)
+    return zipfile.ZIP_DEFLATED if saving >= COMPRESSION_MIN_SAVING else zipfile.ZIP_STORED
+
+
+def read_raw_entry(src_zip, zinfo):
+    """Yield an entry's compressed bytes straight from the archive, without inflating them."""
+    src_fp = src_zip.fp
+    src_fp.seek(zinfo.header_offset)
+    fheader = struct.unpack(zipfile.structFileHeader, src_fp.read(zipfile.sizeFileHeader))
+    src_fp.seek(fheader[_FH_FILENAME_LENGTH] + fheader[_FH_EXTRA_FIELD_LENGTH], os.SEEK_CUR)
+    remaining = zinfo.compress_size
+    while remaining > 0:
+        chunk = src_fp.read(min(COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile(f"Truncated entry {zinfo.filename} in {src_zip.filename}")
+        remaining -= len(chunk)
+        yield chunk
+
+
+def write_raw_entry(dst_zip, zinfo, chunks):
+    """Append an already-compressed entry described by zinfo to dst_zip."""
+    new_info = zipfile.ZipInfo(zinfo.filename, zinfo.date_time)
+    new_info.compress_type = zinfo.compress_type
+    new_info.comment = zinfo.comment
+    new_info.extra = _strip_zip64_extra(zinfo.extra)
+    new_info.create_system = zinfo.create_system
+    new_info.create_version = zinfo.create_version
+    new_info.extract_version = zinfo.extract_version
+    # Sizes and CRC are known up front, so the copy never needs a data descriptor
+    new_info.flag_bits = zinfo.flag_bits & ~_DATA_DESCRIPTOR_FLAG
+    new_info.internal_attr = zinfo.internal_attr
+    new_info.external_attr = zinfo.external_attr
+    new_info.CRC = zinfo.CRC
+    new_info.compress_size = zinfo.compress_size
+    new_info.file_size = zinfo.file_size
+
+    dst_fp = dst_zip.fp
+    new_info.header_offset = dst_fp.tell()
+    zip64 = new_info.file_size > zipfile.ZIP64_LIMIT or new_info.compress_size > zipfile.ZIP64_LIMIT
+    dst_fp.write(new_info.FileHeader(zip64))
+    for chunk in chunks:
+        dst_fp.write(chunk)
+
+    dst_zip.filelist.append(new_info)
+    dst_zip.NameToInfo[new_info.filename] = new_info
+    dst_zip.start_dir = dst_fp.tell()
+    dst_zip._didModify = True
+
+
+def copy_zip_entry_raw(src_zip, dst_zip, zinfo):
+    """Copy one entry's compressed bytes from src_zip into dst_zip without inflating it."""
+    write_raw_entry(dst_zip, zinfo, read_raw_entry(src_zip, zinfo))
+
+
+def write_source_entry(dst_zip, internal_path, source, compression, reader):
+    """Add a mod file to dst_zip as internal_path, compressed as choose_compression picks.
+
+    A file from a mod archive is streamed out of it without a temp file, and if it is
+    already compressed the way it should be, its compressed bytes are copied across
+    as they are, so it is read once and never inflated.
+    """
+    compress_type = choose_compression(source, compression, reader)
+    info = reader.info(source)
+    if info is None:
+        dst_zip.write(source, internal_path, compress_type=compress_type)
+        return
+    zip_path, _ = split_source(source)
+    if info.compress_type == compress_type and not info.flag_bits & _ENCRYPTED_FLAG:
+        zinfo = copy.copy(info)
+        zinfo.filename = internal_path
+        zinfo.extra = b""  # May hold the mod's own name for the entry (Info-ZIP Unicode Path)
+        zinfo.comment = b""
+        dst_zip.fp.seek(dst_zip.start_dir)
+        write_raw_entry(dst_zip, zinfo, read_raw_entry(reader.archive(zip_path), info))
+        return
+    zinfo = zipfile.ZipInfo(internal_path, info.date_time)
+    zinfo.compress_type = compress_type
+    zinfo.external_attr = info.external_attr
+    zinfo.file_size = info.file_size  # Lets zipfile decide on ZIP64 up front
+    with reader.open(source) as src, dst_zip.open(zinfo, "w") as dst:
+        shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+
+
+def entry_record(zinfo, digest):
+    """Describe a zip entry whose compressed bytes are stored as blob digest."""
+    return {
+        "hash": digest,
+        "date_time": list(zinfo.date_time),
+        "compress_type": zinfo.compress_type,
+        "flag_bits": zinfo.flag_bits & ~_DATA_DESCRIPTOR_FLAG,
+        "external_attr": zinfo.external_attr,
+        "create_system": zinfo.create_system,
+        "CRC": zinfo.CRC,
+        "compress_size": zinfo.compress_size,
+        "file_size": zinfo.file_size,
+    }
+
+
+def record_zipinfo(internal_path, record):
+    """Rebuild a ZipInfo from an entry_record so its stored bytes can be written back raw."""
+    zinfo = zipfile.ZipInfo(internal_path, tuple(record["date_time"]))
+    zinfo.compress_type = record["compress_type"]
+    zinfo.flag_bits = record["flag_bits"]
+    zinfo.external_attr = record["external_attr"]
+    zinfo.create_system = record["create_system"]
+    zinfo.CRC = record["CRC"]
+    zinfo.compress_size = record["compress_size"]
+    zinfo.file_size = record["file_size"]
+    return zinfo
+
+
+def fsync_file(path):
+    with open(path, "rb+") as f:
+        os.fsync(f.fileno())
+
+
+def fsync_dir(path):
+    """Flush a directory entry after a rename. Not possible on Windows, where it is skipped."""
+    try:
+        fd = os.open(path or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_json_atomic(path, data):
+    temp_path = path + SWAP_SUFFIX
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def atomic_copy(source, destination, reader=None):
+    """Copy a file so the destination is either the old file or the complete new one.
+
+    With a SourceReader, source may also be a file inside a mod archive.
+    """
+    os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+    temp_path = destination + SWAP_SUFFIX
+    with tracer.span("copy", file=os.path.basename(destination)):
+        if reader and reader.info(source):
+            with reader.open(source) as src, open(temp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_SIZE)
+        else:
+            shutil.copy2(source, temp_path)
+    with tracer.span("fsync", file=os.path.basename(destination)):
+        fsync_file(temp_path)
+        os.replace(temp_path, destination)
+        fsync_dir(os.path.dirname(destination))
+
+
+def rewrite_archive(zip_path, replacements, progress=None, backup_root=None, restore=None, compression="auto", wal_dir=None):
+    """Rewrite zip_path once, replacing or adding every entry in replacements.
+
+    replacements maps internal archive paths to mod files (see SourceReader). Untouched
+    entries are copied across as raw compressed bytes, keeping whatever method they
+    used; only the new files are compressed, as chosen by choose_compression with
+    the compression policy. progress, if given, is called with the fraction of
+    entries written so far.
+
+    The new archive is written to a sibling SWAP_SUFFIX file, fsynced and swapped in
+    with os.replace, so a crash never leaves a truncated archive. With wal_dir, the
+    originals are recorded there just before the swap (see recover_transaction).
+
+    With backup_root, the compressed bytes of every entry being replaced are kept in
+    the blob store first. restore maps internal paths to entry_records to write back
+    from that store, or to None to drop the entry.
+    Returns {internal_path: entry_record or None} for the replaced entries.
+    """
+    restore = restore or {}
+    originals = dict.fromkeys(replacements)
+    os.makedirs(os.path.dirname(zip_path) or ".", exist_ok=True)
+    temp_path = zip_path + SWAP_SUFFIX
+    archive = os.path.basename(zip_path)
+    try:
+        with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED) as dst_zip:
+            with tracer.span("archive_open", archive=archive):
+                src_zip = zipfile.ZipFile(zip_path, "r") if os.path.exists(zip_path) else None
+            try:
+                kept = []
+                with tracer.span("extract", archive=archive):
+                    for zinfo in (src_zip.infolist() if src_zip else []):
+                        if zinfo.filename in replacements:
+                            if backup_root:
+                                digest, _ = store_blob_chunks(read_raw_entry(src_zip, zinfo), backup_root)
+                                originals[zinfo.filename] = entry_record(zinfo, digest)
+                        elif zinfo.filename not in restore:
+                            kept.append(zinfo)
+                total_entries = len(kept) + len(replacements) + len(restore)
+                entries_done = 0
+                with tracer.span("copy", archive=archive, entries=len(kept)):
+                    for zinfo in kept:
+                        copy_zip_entry_raw(src_zip, dst_zip, zinfo)
+                        entries_done += 1
+                        if progress:
+                            progress(entries_done / total_entries)
+            finally:
+                if src_zip:
+                    src_zip.close()
+            with tracer.span("copy", archive=archive, entries=len(restore)):
+                for internal_path, record in restore.items():
+                    if record:
+                        with open(blob_path(backup_root, record["hash"]), "rb") as blob:
+                            write_raw_entry(dst_zip, record_zipinfo(internal_path, record), iter(lambda: blob.read(COPY_CHUNK_SIZE), b""))
+                    entries_done += 1
+                    if progress:
+                        progress(entries_done / total_entries)
+            with tracer.span("recompress", archive=archive, entries=len(replacements)), SourceReader() as reader:
+                for internal_path, source in replacements.items():
+                    write_source_entry(dst_zip, internal_path, source, compression, reader)
+                    entries_done += 1
+                    if progress:
+                        progress(entries_done / total_entries)
+        with tracer.span("fsync", archive=archive):
+            fsync_file(temp_path)
+            if wal_dir:
+                write_json_atomic(wal_record_path(wal_dir, zip_path), {"archive": zip_path, "originals": originals})
+            os.replace(temp_path, zip_path)
+            fsync_dir(os.path.dirname(zip_path))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return originals
+
+
+def archive_tail(zip_path, size):
+    """Hash of the bytes just before offset size: the end records of the archive as it was then."""
+    with open(zip_path, "rb") as f:
+        f.seek(max(size - ARCHIVE_TAIL_SIZE, 0))
+        return hashlib.sha1(f.read(min(size, ARCHIVE_TAIL_SIZE))).hexdigest()
+
+
+def append_still_pending(zip_path, prepared):
+    """Whether zip_path is still the archive an uncommitted append record describes.
+
+    Only then may recover_transaction truncate it back to append_offset: the old end
+    records must still be in place, and once the append was written, its size and
+    mtime must be unchanged. An archive compacted or rewritten since fails this.
+    """
+    offset = prepared["append_offset"]
+    try:
+        st = os.stat(zip_path)
+        if st.st_size < offset or archive_tail(zip_path, offset) != prepared["append_tail"]:
+            return False
+    except (OSError, KeyError):
+        return False
+    return "appended_size" not in prepared or (st.st_size, st.st_mtime_ns) == (prepared["appended_size"], prepared["appended_mtime_ns"])
+
+
+def truncate_archive(zip_path, size):
+    """Cut an unfinished append off zip_path, leaving the archive as it was before."""
+    with open(zip_path, "r+b") as f:
+        f.truncate(size)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def archive_dead_space(zip_path):
+    """Return (dead_bytes, total_bytes) of zip_path.
+
+    Dead bytes are those no live entry or the central directory uses: entries that
+    append_archive replaced or removed, and the central directories it superseded.
+    Each entry's local header is read for its real length, so an archive without
+    any dead space reports exactly 0.
+    """
+    total = os.path.getsize(zip_path)
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        live = total - zf.start_dir  # Central directory and end records
+        fp = zf.fp
+        for zinfo in zf.infolist():
+            fp.seek(zinfo.header_offset)
+            fheader = struct.unpack(zipfile.structFileHeader, fp.read(zipfile.sizeFileHeader))
+            size = zipfile.sizeFileHeader + fheader[_FH_FILENAME_LENGTH] + fheader[_FH_EXTRA_FIELD_LENGTH] + zinfo.compress_size
+            if zinfo.flag_bits & _DATA_DESCRIPTOR_FLAG:
+                fp.seek(zinfo.header_offset + size)
+                zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+                size += (20 if zip64 else 12) + (4 if fp.read(4) == _DATA_DESCRIPTOR_SIGNATURE else 0)
+            live += size
+    return max(total - live, 0), total
+
+
+def append_archive(zip_path, replacements, progress=None, backup_root=None, restore=None, compression="auto", wal_dir=None):
+    """Update zip_path in place, appending entries instead of rewriting the archive.
+
+    New and restored entries are written after the archive's current end, followed by
+    a new central directory that leaves out the entries they replace, so the I/O is
+    only the size of the new files. The old bytes stay behind as dead space until
+    compact_archive. The old central directory is left intact until the new one is
+    complete, and the appended entries are read back through zipfile before the
+    update counts as done; on any failure the archive is truncated back.
+
+    With wal_dir, the archive's old size and end records are recorded before writing,
+    its new size and mtime once written, and the record is marked committed after the
+    check, see recover_transaction. Takes the same arguments and
+    returns the same originals as rewrite_archive.
+    """
+    restore = restore or {}
+    originals = dict.fromkeys(replacements)
+    archive = os.path.basename(zip_path)
+    append_offset = os.path.getsize(zip_path)
+    with tracer.span("archive_open", archive=archive):
+        zf = zipfile.ZipFile(zip_path, "a")
+    try:
+        with tracer.span("extract", archive=archive):
+            for zinfo in zf.infolist():
+                if zinfo.filename in replacements and backup_root:
+                    digest, _ = store_blob_chunks(read_raw_entry(zf, zinfo), backup_root)
+                    originals[zinfo.filename] = entry_record(zinfo, digest)
+        # Drop the superseded entries from the central directory; their bytes become dead space
+        zf.filelist = [zinfo for zinfo in zf.filelist if zinfo.filename not in replacements and zinfo.filename not in restore]
+        for internal_path in list(replacements) + list(restore):
+            zf.NameToInfo.pop(internal_path, None)
+        wal_record = {"archive": zip_path, "originals": originals, "append_offset": append_offset,
+                      "append_tail": archive_tail(zip_path, append_offset), "committed": False}
+        if wal_dir:
+            write_json_atomic(wal_record_path(wal_dir, zip_path), wal_record)
+
+        # Write after the old end record, so the archive stays readable until the new one is in place
+        zf.start_dir = append_offset
+        zf._didModify = True
+        total_entries = max(len(replacements) + len(restore), 1)
+        entries_done = 0
+        with tracer.span("copy", archive=archive, entries=len(restore)):
+            for internal_path, record in restore.items():
+                if record:
+                    zf.fp.seek(zf.start_dir)
+                    with open(blob_path(backup_root, record["hash"]), "rb") as blob:
+                        write_raw_entry(zf, record_zipinfo(internal_path, record), iter(lambda: blob.read(COPY_CHUNK_SIZE), b""))
+                entries_done += 1
+                if progress:
+                    progress(entries_done / total_entries)
+        with tracer.span("recompress", archive=archive, entries=len(replacements)), SourceReader() as reader:
+            for internal_path, source in replacements.items():
+                write_source_entry(zf, internal_path, source, compression, reader)
+                entries_done += 1
+                if progress:
+                    progress(entries_done / total_entries)
+        with tracer.span("fsync", archive=archive):
+            zf.close()
+            fsync_file(zip_path)
+        if wal_dir:
+            st = os.stat(zip_path)
+            wal_record.update(appended_size=st.st_size, appended_mtime_ns=st.st_mtime_ns)
+            write_json_atomic(wal_record_path(wal_dir, zip_path), wal_record)
+
+        with tracer.span("verify", archive=archive):
+            with zipfile.ZipFile(zip_path, "r") as check:
+                # Reading an entry to the end checks its CRC
+                for internal_path in list(replacements) + [path for path, record in restore.items() if record]:
+                    with check.open(internal_path) as f:
+                        while f.read(COPY_CHUNK_SIZE):
+                            pass
+                removed = [path for path, record in restore.items() if not record and path in check.NameToInfo]
+                if removed:
+                    raise zipfile.BadZipFile(f"Removed entries still listed in {archive}: {', '.join(removed)}")
+    except BaseException:
+        zf._didModify = False  # Don't write a central directory for a half-done append
+        zf.close()
+        truncate_archive(zip_path, append_offset)
+        raise
+    if wal_dir:
+        wal_record["committed"] = True
+        write_json_atomic(wal_record_path(wal_dir, zip_path), wal_record)
+    return originals
+
+
+def compact_archive(zip_path):
+    """Rewrite zip_path without its dead space. Returns the number of bytes reclaimed."""
+    size = os.path.getsize(zip_path)
+    with tracer.span("compact", archive=os.path.basename(zip_path)):
+        rewrite_archive(zip_path, {})
+    return size - os.path.getsize(zip_path)
+
+
+def update_archive(zip_path, replacements, progress=None, append=False, compact_threshold=COMPACT_THRESHOLD, **options):
+    """rewrite_archive, or append_archive when append is set and the archive exists.
+
+    An archive updated in append mode is compacted once its dead space goes over
+    compact_threshold. The append is committed by then, so a failed compaction is
+    only logged; the archive stays valid and can be compacted later.
+    """
+    if not (append and os.path.exists(zip_path)):
+        return rewrite_archive(zip_path, replacements, progress=progress, **options)
+    originals = append_archive(zip_path, replacements, progress=progress, **options)
+    try:
+        dead, total = archive_dead_space(zip_path)
+        if total and dead / total > compact_threshold:
+            compact_archive(zip_path)
+    except Exception:
+        logger.warning("Could not compact %s, leaving it uncompacted", zip_path, exc_info=True)
+    return originals
+
+
+# Set in each install worker process so archive rewrites can report progress home
+_worker_progress_queue = None
+
+
+def _init_archive_worker(progress_queue):
+    global _worker_progress_queue
+    _worker_progress_queue = progress_queue
+
+
+def _rewrite_archive_worker(zip_path, replacements, options, trace=False):
+    """Process pool entry point: rewrite one archive, reporting whole-percent progress.
+
+    Returns (originals, trace_events); the events are empty unless trace is set.
+    """
+    tracer.enabled = trace
+    tracer.take()
+    last_percent = [-1]
+
+    def report(fraction):
+        percent = int(fraction * 100)
+        if percent != last_percent[0]:
+            last_percent[0] = percent
+            _worker_progress_queue.put((zip_path, fraction))
+
+    originals = update_archive(zip_path, replacements, progress=report, **options)
+    return originals, tracer.take()
+
+
+def scan_files(folder, base):
+    """Single os.scandir pass over folder.
+
+    Returns {relative_path: os.stat_result} with paths relative to base and "/" separators.
+    """
+    files = {}
+    stack = [folder]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    files[os.path.relpath(entry.path, base).replace("\\", "/")] = entry.stat()
+    return files
+
+
+def blob_path(backup_root, digest):
+    return os.path.join(backup_root, BLOBS_DIR, digest[:2], digest)
+
+
+def store_blob_chunks(chunks, backup_root):
+    """Hash chunks while writing them into the blob store.
+
+    Returns (digest, stored) where stored is False if identical content was already there.
+    """
+    blobs_root = os.path.join(backup_root, BLOBS_DIR)
+    os.makedirs(blobs_root, exist_ok=True)
+    sha = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=blobs_root)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for chunk in chunks:
+                sha.update(chunk)
+                out.write(chunk)
+        digest = sha.hexdigest()
+        target = blob_path(backup_root, digest)
+        if os.path.exists(target):
+            os.remove(temp_path)
+            return digest, False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(temp_path, target)
+        return digest, True
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def store_blob(path, backup_root, on_chunk=None):
+    """Hash path while copying it into the blob store. See store_blob_chunks.
+
+    The file is streamed in COPY_CHUNK_SIZE pieces; on_chunk, if given, is called
+    with the size of each piece as it is written.
+    """
+    with open(path, "rb") as src:
+        chunks = iter(lambda: src.read(COPY_CHUNK_SIZE), b"")
+        if on_chunk:
+            chunks = _report_chunks(chunks, on_chunk)
+        return store_blob_chunks(chunks, backup_root)
+
+
+def store_source_blob(source, backup_root, reader):
+    """Copy a mod file (see SourceReader) into the blob store. Returns (digest, crc32, size)."""
+    crc = size = 0
+
+    def chunks(f):
+        nonlocal crc, size
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            yield chunk
+
+    with reader.open(source) as f:
+        digest, _ = store_blob_chunks(chunks(f), backup_root)
+    return digest, crc, size
+
+
+def stored_layer(source, archive, backup_root, reader):
+    """Store a mod file so it can stand in as the original of a layer installed over it.
+
+    For an archive entry this is an entry_record of the file stored uncompressed,
+    otherwise a loose file original like install_plan records.
+    """
+    digest, crc, size = store_source_blob(source, backup_root, reader)
+    info = reader.info(source)
+    mod_file = split_source(source)[0]
+    if archive is None:
+        return {"hash": digest, "mtime_ns": os.stat(mod_file).st_mtime_ns}
+    zinfo = zipfile.ZipInfo(date_time=info.date_time if info else time.localtime(os.path.getmtime(mod_file))[:6])
+    zinfo.external_attr = 0o644 << 16
+    zinfo.CRC = crc
+    zinfo.compress_size = zinfo.file_size = size
+    return entry_record(zinfo, digest)
+
+
+def _report_chunks(chunks, on_chunk):
+    for chunk in chunks:
+        yield chunk
+        on_chunk(len(chunk))
+
+
+class TransferProgress:
+    """Bytes moved against a known total, with the rate and ETA derived from them."""
+
+    def __init__(self, total_bytes):
+        self.total_bytes = total_bytes
+        self.done_bytes = 0
+        self.started = time.monotonic()
+
+    def advance(self, byte_count):
+        self.done_bytes += byte_count
+
+    @property
+    def fraction(self):
+        return self.done_bytes / self.total_bytes if self.total_bytes else 1.0
+
+    def describe(self):
+        elapsed = time.monotonic() - self.started
+        rate = self.done_bytes / elapsed if elapsed > 0 else 0
+        text = f"{self.done_bytes / (1024 * 1024):.1f}/{self.total_bytes / (1024 * 1024):.1f} MB"
+        if rate > 0:
+            eta = int((self.total_bytes - self.done_bytes) / rate)
+            text += f" at {rate / (1024 * 1024):.1f} MB/s, ETA {eta // 60}:{eta % 60:02d}"
+        return text
+
+
+def list_snapshots(backup_root):
+    """Return snapshot manifest paths, oldest first."""
+    snapshots_root = os.path.join(backup_root, SNAPSHOTS_DIR)
+    if not os.path.isdir(snapshots_root):
+        return []
+    return sorted(os.path.join(snapshots_root, name) for name in os.listdir(snapshots_root) if name.endswith(".json"))
+
+
+def load_snapshot(manifest_path):
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def create_snapshot(game_folder, backup_root, progress=None):
+    """Back up the Scenes folder into the deduplicated store.
+
+    Only files whose size or mtime changed since the previous snapshot are hashed;
+    everything else reuses the recorded hash. progress, if given, is called with a
+    TransferProgress counting the bytes of those changed files.
+    Returns (manifest_path, manifest).
+    """
+    scenes_folder = os.path.join(game_folder, "Scenes")
+    if not os.path.exists(scenes_folder):
+        raise FileNotFoundError(f"Scenes folder not found at {scenes_folder}")
+
+    snapshots = list_snapshots(backup_root)
+    previous = load_snapshot(snapshots[-1])["files"] if snapshots else {}
+
+    files = scan_files(scenes_folder, game_folder)
+    manifest = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "game_folder": game_folder,
+        "files": {},
+        "hashed_files": 0,
+        "stored_bytes": 0,
+    }
+    to_store = []
+    for rel_path, stat in sorted(files.items()):
+        known = previous.get(rel_path)
+        if (known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns
+                and os.path.exists(blob_path(backup_root, known["hash"]))):
+            manifest["files"][rel_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": known["hash"]}
+        else:
+            to_store.append((rel_path, stat))
+
+    # Progress is measured in bytes actually read, so one big archive moves the bar as steadily as many small files
+    transfer = TransferProgress(sum(stat.st_size for _, stat in to_store))
+
+    def on_chunk(byte_count):
+        transfer.advance(byte_count)
+        if progress:
+            progress(transfer)
+
+    for rel_path, stat in to_store:
+        with tracer.span("hash", file=rel_path):
+            digest, stored = store_blob(os.path.join(game_folder, rel_path), backup_root, on_chunk=on_chunk)
+        manifest["hashed_files"] += 1
+        if stored:
+            manifest["stored_bytes"] += stat.st_size
+        manifest["files"][rel_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": digest}
+    manifest["files"] = dict(sorted(manifest["files"].items()))
+
+    snapshots_root = os.path.join(backup_root, SNAPSHOTS_DIR)
+    os.makedirs(snapshots_root, exist_ok=True)
+    manifest_path = os.path.join(snapshots_root, f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, manifest_path)
+    return manifest_path, manifest
+
+
+def hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def file_crc32(path):
+    """CRC-32 of a file, as stored in a zip central directory."""
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def same_contents(source, path, reader):
+    """Whether a mod file has the same contents as the file at path."""
+    if reader.info(source) is None:
+        return filecmp.cmp(source, path, shallow=False)
+    return reader.size(source) == os.path.getsize(path) and reader.crc32(source) == file_crc32(path)
+
+
+def diff_snapshot(manifest, game_folder):
+    """Compare a snapshot manifest with the live Scenes tree.
+
+    Returns (changes, extra) where changes is a sorted list of (relative_path, reason)
+    for files that need restoring and extra lists live files the snapshot doesn't know.
+    Files whose size matches but mtime doesn't are settled by hashing them.
+    """
+    files = manifest["files"]
+    scenes_folder = os.path.join(game_folder, "Scenes")
+    live = scan_files(scenes_folder, game_folder) if os.path.isdir(scenes_folder) else {}
+
+    changes = []
+    to_verify = []
+    for rel_path, record in files.items():
+        stat = live.get(rel_path)
+        if stat is None:
+            changes.append((rel_path, "missing"))
+        elif stat.st_size != record["size"]:
+            changes.append((rel_path, "changed"))
+        elif stat.st_mtime_ns != record["mtime_ns"]:
+            to_verify.append(rel_path)
+
+    if to_verify:
+        with ThreadPoolExecutor(max_workers=RESTORE_IO_WORKERS) as pool:
+            digests = pool.map(lambda rel_path: hash_file(os.path.join(game_folder, rel_path)), to_verify)
+            for rel_path, digest in zip(to_verify, digests):
+                if digest != files[rel_path]["hash"]:
+                    changes.append((rel_path, "changed"))
+
+    extra = sorted(rel_path for rel_path in live if rel_path not in files)
+    return sorted(changes), extra
+
+
+def restore_snapshot(manifest, game_folder, backup_root, changes=None, dry_run=False, progress=None):
+    """Restore only the files that differ from a snapshot manifest.
+
+    changes defaults to diff_snapshot's result. With dry_run nothing is written.
+    Returns the list of (relative_path, reason) that was (or would be) restored.
+    """
+    if changes is None:
+        changes, _ = diff_snapshot(manifest, game_folder)
+    if dry_run or not changes:
+        return changes
+
+    files = manifest["files"]
+
+    def restore_file(rel_path):
+        record = files[rel_path]
+        destination = os.path.join(game_folder, rel_path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        with tracer.span("copy", file=rel_path):
+            shutil.copyfile(blob_path(backup_root, record["hash"]), destination)
+        # Keep the recorded mtime so the next diff or snapshot sees the file as unchanged
+        os.utime(destination, ns=(record["mtime_ns"], record["mtime_ns"]))
+
+    with ThreadPoolExecutor(max_workers=RESTORE_IO_WORKERS) as pool:
+        futures = [pool.submit(restore_file, rel_path) for rel_path, _ in changes]
+        for files_processed, future in enumerate(futures, 1):
+            future.result()
+            if progress:
+                progress(files_processed / len(futures))
+    return changes
+
+
+def append_journal(backup_root, records):
+    """Append install/uninstall records to the journal and flush them to disk."""
+    os.makedirs(backup_root, exist_ok=True)
+    with open(os.path.join(backup_root, JOURNAL_FILE), "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_journal(backup_root):
+    journal_path = os.path.join(backup_root, JOURNAL_FILE)
+    if not os.path.exists(journal_path):
+        return []
+    records = []
+    with open(journal_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # A torn final line from an interrupted write; everything before it is intact
+                continue
+    return records
+
+
+def replay_journal(records):
+    """Replay the journal into the current stack of installs per file.
+
+    Returns {(archive, entry): [{"mod": ..., "original": ...}, ...]}, bottom layer first.
+    archive is None for loose files, in which case entry is the full destination path.
+    """
+    layers = {}
+    for record in records:
+        if record["op"] == "install":
+            stack = layers.setdefault((record["archive"], record["entry"]), [])
+            if stack and stack[-1]["mod"] == record["mod"]:
+                continue  # Reinstalled over itself, the original underneath is unchanged
+            stack.append({"mod": record["mod"], "original": record["original"]})
+        elif record["op"] == "uninstall":
+            plan_uninstall(layers, record["mod"])
+    return layers
+
+
+def layer_records(record, original, beneath, stored):
+    """Journal records for one installed entry, bottom layer first.
+
+    record is the winning mod's record without its original. Each mod in beneath
+    ([(source, mod_folder)] from plan_install) gets a layer over original, and each
+    layer's stored file (from stored_layer) is the original of the one above it.
+    """
+    records = []
+    for (source, mod_folder), layer_file in zip(beneath, stored):
+        records.append(dict(record, mod=mod_folder, source=source, original=original))
+        original = layer_file
+    records.append(dict(record, original=original))
+    return records
+
+
+def plan_uninstall(layers, mod):
+    """Remove mod from the replayed journal layers.
+
+    Returns {(archive, entry): original} for the files mod is currently on top of and
+    which must be put back. Where another mod was installed over it, that mod inherits
+    the original instead, so uninstalling it later still gets back to vanilla.
+    """
+    restorations = {}
+    for key, stack in list(layers.items()):
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i]["mod"] != mod:
+                continue
+            if i == len(stack) - 1:
+                restorations[key] = stack[i]["original"]
+            else:
+                stack[i + 1]["original"] = stack[i]["original"]
+            del stack[i]
+        if not stack:
+            del layers[key]
+    return restorations
+
+
+def wal_record_path(wal_dir, zip_path):
+    return os.path.join(wal_dir, hashlib.sha1(zip_path.encode("utf-8")).hexdigest() + ".json")
+
+
+def check_no_pending_transactions(backup_root):
+    """Raise RuntimeError if an interrupted install or uninstall hasn't been recovered.
+
+    Recovering it later would roll its archives back over anything done since.
+    """
+    pending = pending_transactions(backup_root)
+    if pending:
+        raise RuntimeError(f"{len(pending)} interrupted install or uninstall must be recovered first "
+                           f"(restart the mod manager, or run the recover command)")
+
+
+def begin_transaction(backup_root, kind, mod, jobs):
+    """Write the plan for a multi-archive rewrite before touching any archive.
+
+    jobs maps zip paths to {"replacements", "restore", "compression"}. Returns the
+    transaction directory, which rewrite_archive records each swap in. Refuses to
+    start while an earlier transaction is still pending.
+    """
+    check_no_pending_transactions(backup_root)
+    # time_ns keeps ids unique, the journal tells finished transactions apart by them
+    txn_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{time.time_ns()}_{os.getpid()}_{threading.get_ident()}"
+    wal_dir = os.path.join(backup_root, TRANSACTIONS_DIR, txn_id)
+    os.makedirs(wal_dir, exist_ok=True)
+    write_json_atomic(os.path.join(wal_dir, "begin.json"), {"id": txn_id, "kind": kind, "mod": mod, "jobs": jobs})
+    return wal_dir
+
+
+def finish_transaction(wal_dir):
+    shutil.rmtree(wal_dir, ignore_errors=True)
+
+
+def pending_transactions(backup_root):
+    """Transaction directories left behind by an install or uninstall that never finished."""
+    transactions_root = os.path.join(backup_root, TRANSACTIONS_DIR)
+    if not os.path.isdir(transactions_root):
+        return []
+    return sorted(os.path.join(transactions_root, name) for name in os.listdir(transactions_root))
+
+
+def read_transaction(wal_dir):
+    """The begin.json plan of a transaction, or None if it was interrupted before writing one."""
+    begin_path = os.path.join(wal_dir, "begin.json")
+    if not os.path.exists(begin_path):
+        return None
+    with open(begin_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def recover_transaction(wal_dir, backup_root, rollback=True):
+    """Bring the archives of an interrupted transaction back to a consistent state.
+
+    Only the archives named in the transaction are touched. An archive whose temp file
+    is still there was never swapped, so the temp file is just removed. A swapped
+    install is either rolled back to its recorded originals, or kept and the missing
+    archives are rewritten to finish the install (rollback=False). Uninstalls are
+    always finished. Returns a short description of what was done.
+    """
+    begin = read_transaction(wal_dir)
+    if begin is None:
+        finish_transaction(wal_dir)  # Interrupted before anything was planned
+        return "nothing to recover"
+
+    if any(record.get("txn") == begin["id"] for record in read_journal(backup_root)):
+        # The journal was written, only the cleanup was missed
+        for zip_path in begin["jobs"]:
+            if os.path.exists(zip_path + SWAP_SUFFIX):
+                os.remove(zip_path + SWAP_SUFFIX)
+        finish_transaction(wal_dir)
+        return "already complete"
+
+    now = datetime.now().isoformat(timespec="seconds")
+    records = []
+    for zip_path, job in begin["jobs"].items():
+        record_path = wal_record_path(wal_dir, zip_path)
+        prepared = None
+        if os.path.exists(record_path):
+            with open(record_path, "r", encoding="utf-8") as f:
+                prepared = json.load(f)
+        temp_path = zip_path + SWAP_SUFFIX
+        changed = False
+        if prepared is not None and "append_offset" in prepared:
+            # Appended in place: done once committed, otherwise cut back to the old archive
+            swapped = prepared["committed"]
+            if not swapped and append_still_pending(zip_path, prepared):
+                truncate_archive(zip_path, prepared["append_offset"])
+            elif not swapped:
+                # Changed since (e.g. compacted), so truncating would destroy it. Redo the
+                # step from the recorded originals instead, which is right either way.
+                logger.warning("%s changed after its append was interrupted, not truncating it", zip_path)
+                swapped = changed = True
+        else:
+            swapped = prepared is not None and not os.path.exists(temp_path)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+        if begin["kind"] == "install" and rollback:
+            if swapped:
+                rewrite_archive(zip_path, {}, backup_root=backup_root, restore=prepared["originals"])
+        elif begin["kind"] == "install":
+            if changed:
+                rewrite_archive(zip_path, job["replacements"], compression=job["compression"])
+            originals = prepared["originals"] if swapped else rewrite_archive(
+                zip_path, job["replacements"], backup_root=backup_root, compression=job["compression"])
+            for internal_path, source in job["replacements"].items():
+                records.extend(layer_records({"op": "install", "mod": job.get("owners", {}).get(internal_path, begin["mod"]),
+                                              "time": now, "txn": begin["id"], "archive": zip_path,
+                                              "entry": internal_path, "source": source},
+                                             originals[internal_path], job.get("beneath", {}).get(internal_path, ()),
+                                             job.get("stored", {}).get(internal_path, ())))
+        elif changed or not swapped:
+            rewrite_archive(zip_path, {}, backup_root=backup_root, restore=job["restore"])
+
+    if begin["kind"] == "uninstall":
+        records.append({"op": "uninstall", "mod": begin["mod"], "time": now, "txn": begin["id"]})
+    if records:
+        append_journal(backup_root, records)
+    finish_transaction(wal_dir)
+    if begin["kind"] == "install" and rollback:
+        return f"rolled back install of '{begin['mod']}'"
+    return f"finished {begin['kind']} of '{begin['mod']}'"
+
+
+def load_catalog(catalog_path):
+    """Load the mod catalog cache, or an empty one if it is missing, corrupt or outdated."""
+    try:
+        with open(catalog_path, "r", encoding="utf-8") as f:
+            catalog = json.load(f)
+        if catalog.get("version") == CATALOG_VERSION:
+            return catalog["mods"]
+    except (OSError, ValueError, KeyError, AttributeError):
+        pass
+    return {}
+
+
+def save_catalog(catalog_path, mods):
+    temp_path = catalog_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": CATALOG_VERSION, "mods": mods}, f)
+    os.replace(temp_path, catalog_path)
+
+
+def index_record(zinfo):
+    """Describe a central directory entry for the archive index."""
+    return {
+        "CRC": zinfo.CRC,
+        "compress_size": zinfo.compress_size,
+        "file_size": zinfo.file_size,
+        "header_offset": zinfo.header_offset,
+        "compress_type": zinfo.compress_type,
+    }
+
+
+class ArchiveIndex:
+    """Persistent index of the central directory of every scene archive.
+
+    Each archive's entries are stored with its size and mtime, and an archive is only
+    re-read when either has changed, so looking up what the game already ships never
+    parses the big archives again. Shared between the Tk thread and workers, so every
+    change goes through a lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.archives = self.load()  # zip_path -> {"stat": [size, mtime_ns], "entries": {internal_path: index_record}}
+        self.dirty = False
+
+    def load(self):
+        """The saved index, or an empty one if it is missing, corrupt or outdated."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("version") == ARCHIVE_INDEX_VERSION:
+                return index["archives"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+        return {}
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            write_json_atomic(self.path, {"version": ARCHIVE_INDEX_VERSION, "archives": self.archives})
+            self.dirty = False
+
+    def entries(self, zip_path):
+        """Return {internal_path: index_record} for zip_path, re-reading it only if it changed.
+
+        Missing or unreadable archives have no entries.
+        """
+        try:
+            stat = os.stat(zip_path)
+        except OSError:
+            with self.lock:
+                if self.archives.pop(zip_path, None) is not None:
+                    self.dirty = True
+            return {}
+        key = [stat.st_size, stat.st_mtime_ns]
+        with self.lock:
+            cached = self.archives.get(zip_path)
+        if cached and cached["stat"] == key:
+            return cached["entries"]
+        try:
+            with tracer.span("index", archive=os.path.basename(zip_path)):
+                with zipfile.ZipFile(zip_path, "r") as zf:
+                    entries = {zinfo.filename: index_record(zinfo) for zinfo in zf.infolist()}
+        except (OSError, zipfile.BadZipFile) as e:
+            logger.warning("Could not index %s: %s", zip_path, e)
+            return {}
+        with self.lock:
+            self.archives[zip_path] = {"stat": key, "entries": entries}
+            self.dirty = True
+        return entries
+
+    def lookup(self, full_destination):
+        """The index_record of the archive entry a mapped destination replaces, or None."""
+        zip_path, internal_path = split_archive_path(full_destination)
+        if internal_path is None:
+            return None
+        return self.entries(zip_path).get(internal_path)
+
+    def refresh(self, game_folder):
+        """Bring every archive under the game's Scenes folder up to date and forget the rest.
+
+        Returns the number of archives indexed.
+        """
+        zip_paths = set()
+        for root, _, files in os.walk(os.path.join(game_folder, "Scenes")):
+            zip_paths.update(os.path.join(root, name) for name in files if name.lower().endswith(".zip"))
+        for zip_path in sorted(zip_paths):
+            self.entries(zip_path)
+        with self.lock:
+            for zip_path in [path for path in self.archives if path not in zip_paths]:
+                del self.archives[zip_path]
+                self.dirty = True
+        return len(zip_paths)
+
+
+def mod_stat_key(entry):
+    """(mtime_ns, size) of a Mods folder entry that changes whenever the mod does.
+
+    Extracted mods are keyed by their mod.txt, mod archives by the .zip itself.
+    Returns None for anything that can't be a mod.
+    """
+    try:
+        if entry.is_dir():
+            stat = os.stat(os.path.join(entry.path, "mod.txt"))
+        elif entry.name.lower().endswith(".zip"):
+            stat = entry.stat()
+        else:
+            return None
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def find_mod_root(names):
+    """The folder holding mod.txt among a mod archive's entry names ("" for the top level), or None."""
+    roots = [name[:-len("mod.txt")] for name in names if name.lower() == "mod.txt" or name.lower().endswith("/mod.txt")]
+    return min(roots, key=lambda root: root.count("/")) if roots else None
+
+
+def snapshot_mods_folder(mods_path):
+    """Stat every mod folder's mod.txt, and every mod archive, in one os.scandir pass.
+
+    Returns {folder_name: (mtime_ns, size)}, the same key load_mods caches by.
+    """
+    snapshot = {}
+    if not os.path.isdir(mods_path):
+        return snapshot
+    with os.scandir(mods_path) as entries:
+        for entry in entries:
+            key = mod_stat_key(entry)
+            if key is not None:
+                snapshot[entry.name] = key
+    return snapshot
+
+
+class ModFolderWatcher(threading.Thread):
+    """Polls the Mods folder and reports per-mod changes.
+
+    on_change(removed, updated) is called from the watcher thread with a set of
+    removed folder names and {folder_name: mod_info} for added or changed mods.
+    """
+
+    def __init__(self, mods_path, parse_mod_info, on_change, interval=WATCH_INTERVAL):
+        super().__init__(daemon=True)
+        self.mods_path = mods_path
+        self.parse_mod_info = parse_mod_info
+        self.on_change = on_change
+        self.interval = interval
+        self.snapshot = snapshot_mods_folder(mods_path)
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                current = snapshot_mods_folder(self.mods_path)
+                removed = self.snapshot.keys() - current.keys()
+                updated = {}
+                for folder, key in current.items():
+                    if self.snapshot.get(folder) != key:
+                        updated[folder] = self.parse_mod_info(os.path.join(self.mods_path, folder))
+                self.snapshot = current
+                if removed or updated:
+                    self.on_change(set(removed), updated)
+            except Exception:
+                logger.exception("Error watching mods folder")
+
+
+def queue_reporters(events):
+    """status, progress and log_error callbacks that post events to a thread-safe queue.
+
+    Events are ("status", message), ("progress", percent) and ("error", message).
+    Progress is only posted when the whole percentage changes, so a consumer sees at
+    most a hundred or so updates per operation no matter how many files it touches.
+    """
+    last_percent = [None]
+
+    def progress(percent):
+        percent = int(percent)
+        if percent != last_percent[0]:
+            last_percent[0] = percent
+            events.put(("progress", percent))
+
+    return (lambda message: events.put(("status", message)), progress,
+            lambda message: events.put(("error", message)))
+
+
+def traced_operation(name):
+    """ModEngine method decorator: trace the whole call as one operation, see finish_trace."""
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not tracer.enabled:
+                return method(self, *args, **kwargs)
+            tracer.take()  # Drop whatever was recorded between operations
+            try:
+                with tracer.span(name):
+                    return method(self, *args, **kwargs)
+            finally:
+                self.finish_trace(name, tracer.take())
+        return wrapper
+    return decorate
+
+
+class ModEngine:
+    """Install, uninstall and backup logic shared by the GUI and the command line.
+
+    Nothing here touches Tk. status(message), progress(percent) and log_error(message)
+    are optional callbacks; pass events (a queue.Queue) instead to receive them as
+    queued events, see queue_reporters. confirm_executable(source) decides whether an
+    executable mod file may be installed and defaults to refusing.
+    """
+
+    def __init__(self, config, mods_path=MODS_PATH, catalog_path=CATALOG_PATH,
+                 status=None, progress=None, log_error=None, confirm_executable=None, events=None):
+        self.config = config
+        self.mods_path = mods_path
+        self.catalog_path = catalog_path
+        if events is not None:
+            status, progress, log_error = queue_reporters(events)
+        self.status = status or (lambda message: None)
+        self.progress = progress or (lambda percent: None)
+        self.log_error = log_error or logger.error
+        self.confirm_executable = confirm_executable or (lambda source: False)
+        # Off unless enabled under [Tracing]; chrome_trace_dir also saves each operation's spans
+        tracer.enabled = config.getboolean("Tracing", "enabled", fallback=False)
+        self.chrome_trace_dir = config.get("Tracing", "chrome_trace_dir", fallback="")
+        self.traces = []
+        self.archive_index = None
+
+    def get_game_folder(self):
+        game_folder = self.config.get("Settings", "game_install_folder", fallback="")
+        if not game_folder or not os.path.isdir(game_folder):
+            raise ValueError(f"Invalid game folder path: {game_folder}")
+        return game_folder
+
+    def get_backup_folder(self):
+        return self.config.get("Settings", "backup_folder", fallback=BACKUP_PATH) or BACKUP_PATH
+
+    def get_archive_index(self):
+        """The ArchiveIndex kept in the current backup folder."""
+        path = os.path.join(self.get_backup_folder(), ARCHIVE_INDEX_FILE)
+        if self.archive_index is None or self.archive_index.path != path:
+            self.archive_index = ArchiveIndex(path)
+        return self.archive_index
+
+    def save_archive_index(self):
+        try:
+            self.get_archive_index().save()
+        except OSError as e:
+            self.log_error(f"Could not save archive index: {e}")
+
+    @traced_operation("index")
+    def refresh_archive_index(self):
+        """Re-read the central directory of every scene archive that changed since the last run."""
+        count = self.get_archive_index().refresh(self.get_game_folder())
+        self.save_archive_index()
+        return count
+
+    def existing_entries(self, mod):
+        """Targets of mod that replace a file the game's scene archives already have.
+
+        Answered from the archive index. Returns {(archive, entry): index_record}.
+        """
+        game_folder = self.get_game_folder()
+        index = self.get_archive_index()
+        existing = {}
+        for archive, entry in mod_targets(mod):
+            record = index.entries(os.path.join(game_folder, archive)).get(entry) if archive is not None else None
+            if record:
+                existing[(archive, entry)] = record
+        self.save_archive_index()
+        return existing
+
+    def get_install_workers(self, archive_count):
+        """Number of processes to rewrite archives with; 0 in config.ini means one per CPU core."""
+        workers = self.config.getint("Settings", "install_workers", fallback=0)
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        return max(1, min(workers, archive_count))
+
+    def get_append_updates(self):
+        """Whether archives are updated by appending to them (see append_archive) instead of rewriting."""
+        return self.config.getboolean("Archives", "append_updates", fallback=False)
+
+    def get_compact_threshold(self):
+        return self.config.getfloat("Archives", "compact_threshold", fallback=COMPACT_THRESHOLD)
+
+    def get_compression_policy(self, zip_path):
+        """Compression policy for an archive: its own key under [Compression], else the default."""
+        policy = self.config.get("Compression", os.path.basename(zip_path).lower(), fallback=None)
+        if policy is None:
+            policy = self.config.get("Compression", "default", fallback="auto")
+        policy = policy.strip().lower()
+        return policy if policy in COMPRESSION_POLICIES else "auto"
+
+    @traced_operation("load_mods")
+    def load_mods(self):
+        """Load the mod library, only re-parsing mod.txt files whose mtime or size changed."""
+        mods = []
+        cached = load_catalog(self.catalog_path)
+        catalog = {}
+        changed = False
+        if os.path.isdir(self.mods_path):
+            with os.scandir(self.mods_path) as entries:
+                for entry in sorted(entries, key=lambda e: e.name):
+                    key = mod_stat_key(entry)
+                    if key is None:
+                        continue  # Not a mod folder or mod archive
+                    key = list(key)
+                    hit = cached.get(entry.name)
+                    if hit and hit["stat"] == key:
+                        mod_info = hit["info"]
+                    else:
+                        with tracer.span("parse", mod=entry.name):
+                            mod_info = self.parse_mod_info(entry.path)
+                        changed = True
+                    catalog[entry.name] = {"stat": key, "info": mod_info}
+                    if mod_info:
+                        mods.append(mod_info)
+        if changed or catalog.keys() != cached.keys():
+            try:
+                save_catalog(self.catalog_path, catalog)
+            except OSError as e:
+                self.log_error(f"Could not save mod catalog: {e}")
+        return mods
+
+    def parse_mod_info(self, mod_path):
+        """Parse the mod.txt of a mod folder or mod .zip, or return None if it has none.
+
+        A mod archive is read in place; "root" is the folder inside it holding mod.txt.
+        """
+        if os.path.isfile(mod_path) and mod_path.lower().endswith(".zip"):
+            try:
+                with zipfile.ZipFile(mod_path, "r") as zf:
+                    names = zf.namelist()
+                    root = find_mod_root(names)
+                    if root is None:
+                        return None
+                    lines = zf.read(root + "mod.txt").decode("utf-8", errors="replace").splitlines()
+            except (OSError, zipfile.BadZipFile) as e:
+                logger.warning("Could not read mod archive %s: %s", mod_path, e)
+                return None
+            mod_info = self.parse_mod_lines(lines, os.path.basename(mod_path))
+            mod_info["root"] = root
+            # Entry names are case-sensitive, mod.txt was written against a Windows folder
+            entries = {name.lower(): name for name in names}
+            for file_info in mod_info["files"]:
+                name = entries.get((root + file_info["source"]).replace("\\", "/").lower())
+                if name:
+                    file_info["source"] = name[len(root):]
+            return mod_info
+
+        mod_txt_path = os.path.join(mod_path, "mod.txt")
+        if os.path.exists(mod_txt_path):
+            with open(mod_txt_path, 'r') as f:
+                lines = f.readlines()
+            return self.parse_mod_lines(lines, os.path.basename(mod_path))
+        return None
+
+    def parse_mod_lines(self, lines, folder):
+        """Build a mod's info from the lines of its mod.txt."""
+        mod_info = {
+            "name": "",
+            "author": "",
+            "description": "",
+            "files": [],
+            "folder": folder
+        }
+
+        for line in lines:
+            if line.startswith("Name:"):
+                mod_info["name"] = line.split(":", 1)[1].strip()
+            elif line.startswith("Author:"):
+                mod_info["author"] = line.split(":", 1)[1].strip()
+            elif line.startswith("Description:"):
+                mod_info["description"] = line.split(":", 1)[1].strip()
+            elif ":" in line and not line.startswith("#"):
+                destination, source = map(str.strip, line.split(":", 1))
+                mod_info["files"].append({"source": source, "destination": destination})
+
+        return mod_info
+
+    def mod_file(self, mod, name):
+        """Path of a file of the mod, inside its mod archive for mods that aren't extracted."""
+        return os.path.join(self.mods_path, mod["folder"], mod.get("root", ""), name)
+
+    def mod_sources(self, mod):
+        return [self.mod_file(mod, file_info["source"]) for file_info in mod["files"]]
+
+    def install_mod(self, mod):
+        """Install every file of a parsed mod. See install_mod_files."""
+        return self.install_mod_files(self.mod_sources(mod), mod["folder"])
+
+    @traced_operation("install")
+    def install_mod_files(self, sources, mod_folder):
+        """Install mod files, rewriting each target scene archive exactly once.
+
+        Returns a list of (source, full_destination) pairs that were installed.
+        """
+        return self.install_plan(self.route_sources(sources, mod_folder), mod_folder)
+
+    @traced_operation("install")
+    def install_mods(self, mods, keep_first=False):
+        """Install several mods as one merged plan, see plan_install and install_plan.
+
+        Every scene archive is rewritten once for the whole batch, however many of the
+        mods write into it. Returns the installed (source, full_destination) pairs.
+        """
+        plan, beneath = self.plan_install(mods, keep_first)
+        return self.install_plan(plan, ", ".join(mod["folder"] for mod in mods), beneath)
+
+    def route_sources(self, sources, mod_folder):
+        """Route one mod's files to the game folder, skipping executables that aren't confirmed.
+
+        Returns a list of (source, full_destination, mod_folder).
+        """
+        game_folder = self.get_game_folder()
+        accepted = []
+        for source in sources:
+            # Check for executable files and ask before installing them
+            if source.lower().endswith(EXECUTABLE_EXTENSIONS) and not self.confirm_executable(source):
+                self.status(f"Skipped {os.path.basename(source)}")
+                continue  # Skip the installation for this file
+            accepted.append(source)
+
+        # Route the whole manifest at once to determine the correct destinations
+        with tracer.span("route", files=len(accepted)):
+            mapped_destinations = route_many([os.path.basename(source) for source in accepted], mod_folder)
+        return [(source, os.path.join(game_folder, mapped_destination), mod_folder)
+                for source, mapped_destination in zip(accepted, mapped_destinations)]
+
+    def plan_install(self, mods, keep_first=False):
+        """Merge the routed files of mods into one plan with a single file per destination.
+
+        mods are in priority order: when two mods write the same destination the later
+        one wins, or the earlier one with keep_first.
+        Returns (plan, beneath): plan is a list of (source, full_destination, mod_folder)
+        and beneath maps split_archive_path(full_destination) to the [(source, mod_folder)]
+        the winner overrides, bottom first, as if the mods were installed one by one.
+        """
+        plan = {}
+        beneath = {}
+        for mod in (reversed(mods) if keep_first else mods):
+            for source, full_destination, mod_folder in self.route_sources(self.mod_sources(mod), mod["folder"]):
+                key = split_archive_path(full_destination)
+                if key in plan and plan[key][2] != mod_folder:
+                    beneath.setdefault(key, []).append((plan[key][0], plan[key][2]))
+                plan[key] = (source, full_destination, mod_folder)
+        return list(plan.values()), beneath
+
+    def install_plan(self, plan, label, beneath=None):
+        """Install a plan from route_sources or plan_install.
+
+        Each entry is journaled under its own mod, so the mods of a batch can be
+        uninstalled separately. Only the winning file of an entry is written, but the
+        mods in beneath (from plan_install) are journaled as layers under it, so the
+        batch uninstalls exactly like mods installed one after another.
+        label names the install in its transaction.
+        Returns a list of (source, full_destination) pairs that were installed.
+        """
+        beneath = beneath or {}
+        installed_files = []
+        backup_root = self.get_backup_folder()
+        check_no_pending_transactions(backup_root)  # Before the loose files, which are copied outside the transaction
+        owners = {split_archive_path(full_destination): mod_folder for _, full_destination, mod_folder in plan}
+        archives, loose_files = group_install_files([(source, full_destination) for source, full_destination, _ in plan])
+        # Mod archives are opened once for comparing and copying, instead of once per file
+        with SourceReader() as reader:
+            with tracer.span("compare", files=len(plan)):
+                archives, loose_files, unchanged = self.drop_unchanged(archives, loose_files, owners, backup_root, reader, beneath)
+            if unchanged:
+                self.status(f"Skipped {unchanged} files that are already installed")
+            # The overridden files become the originals of the layers above them
+            stored = {}
+            for key, layers in beneath.items():
+                try:
+                    stored[key] = [stored_layer(source, key[0] if key[1] is not None else None, backup_root, reader)
+                                   for source, _ in layers]
+                except (OSError, KeyError) as e:
+                    logger.debug("Could not store the files beneath %s", key, exc_info=True)
+                    self.log_error(f"Could not keep the {key[1] or key[0]} of {', '.join(mod for _, mod in layers)}; "
+                                   f"uninstalling the mod that overrides it will restore the game's file: {e}")
+            total_steps = len(archives) + len(loose_files)
+            steps_done = 0
+            install_time = datetime.now().isoformat(timespec="seconds")
+
+            # Place loose files in regular directories, just copy them directly
+            for source, full_destination in loose_files:
+                try:
+                    original = None
+                    if os.path.exists(full_destination):
+                        # Keep the file we are about to overwrite so uninstall can put it back
+                        digest, _ = store_blob(full_destination, backup_root)
+                        original = {"hash": digest, "mtime_ns": os.stat(full_destination).st_mtime_ns}
+                    atomic_copy(source, full_destination, reader)
+                    append_journal(backup_root, layer_records({"op": "install", "mod": owners[(full_destination, None)], "time": install_time,
+                                                               "archive": None, "entry": full_destination, "source": source},
+                                                              original, beneath.get((full_destination, None), ()),
+                                                              stored.get((full_destination, None), ())))
+                    installed_files.append((source, full_destination))
+                    self.status(f"Copied file to: {full_destination}")
+                except Exception as e:
+                    logger.debug("Error installing %s", source, exc_info=True)
+                    error_msg = f"Error installing {source}: {e}"
+                    self.status(f"Last error: {error_msg}")
+                    self.log_error(error_msg)
+                steps_done += 1
+                self.progress(steps_done / total_steps * 100)
+
+        # One rewrite per scene archive, no matter how many files land in it
+        def archive_progress(fraction_sum):
+            self.progress((steps_done + fraction_sum) / total_steps * 100)
+
+        if not archives:
+            return installed_files
+
+        # Check the routes against the index; a file that matches no existing entry is added
+        index = self.get_archive_index()
+        for zip_path, replacements in archives.items():
+            if not os.path.exists(zip_path):
+                logger.warning("%s is not an existing scene archive, it will be created", zip_path)
+                continue
+            entries = index.entries(zip_path)
+            for internal_path in replacements:
+                if internal_path not in entries:
+                    logger.info("%s is not in %s, adding it as a new entry", internal_path, zip_path)
+
+        # Log the plan first so an interrupted install can be rolled back or finished on next launch
+        jobs = self.plan_archive_jobs(archives, owners=owners, beneath=beneath, stored=stored)
+        wal_dir = begin_transaction(backup_root, "install", label, jobs)
+        txn_id = os.path.basename(wal_dir)
+        records = []
+        for zip_path, originals, error in self.rewrite_archives(jobs, archive_progress, backup_root=backup_root, wal_dir=wal_dir):
+            replacements = archives[zip_path]
+            if error is None:
+                for internal_path, source in replacements.items():
+                    key = (zip_path, internal_path)
+                    records.extend(layer_records({"op": "install", "mod": owners[key], "time": install_time, "txn": txn_id,
+                                                  "archive": zip_path, "entry": internal_path, "source": source},
+                                                 originals[internal_path], beneath.get(key, ()), stored.get(key, ())))
+                installed_files.extend((source, f"{zip_path}/{internal_path}") for internal_path, source in replacements.items())
+                self.status(f"Updated zip file: {zip_path}")
+            else:
+                error_msg = f"Error updating {zip_path}: {error}"
+                self.status(f"Last error: {error_msg}")
+                self.log_error(error_msg)
+        append_journal(backup_root, records)
+        finish_transaction(wal_dir)
+        self.save_archive_index()
+
+        return installed_files
+
+    def drop_unchanged(self, archives, loose_files, owners, backup_root, reader, beneath):
+        """Leave out files that are byte-identical to what is already in the game.
+
+        Archive entries are compared by size and CRC-32 against the archive index, so
+        an archive with nothing new in it is not rewritten at all; loose files are
+        compared byte for byte, or by CRC-32 when they come from a mod archive. A file is only
+        dropped when the mod installing it is already the top layer in the journal,
+        or no mod is (the game's own file), and no other mod of the batch (beneath)
+        writes it, so uninstalls still restore correctly.
+        Returns (archives, loose_files, number_of_files_dropped).
+        """
+        layers = replay_journal(read_journal(backup_root))
+        index = self.get_archive_index()
+
+        def owned(key, mod_folder):
+            stack = layers.get(key)
+            return key not in beneath and (not stack or stack[-1]["mod"] == mod_folder)
+
+        kept_archives = {}
+        unchanged = 0
+        for zip_path, replacements in archives.items():
+            entries = index.entries(zip_path)
+            kept = {}
+            for internal_path, source in replacements.items():
+                record = entries.get(internal_path)
+                try:
+                    same = (record and owned((zip_path, internal_path), owners[(zip_path, internal_path)])
+                            and reader.size(source) == record["file_size"] and reader.crc32(source) == record["CRC"])
+                except (OSError, KeyError):
+                    same = False  # A missing mod file, reported when it is installed
+                if same:
+                    unchanged += 1
+                else:
+                    kept[internal_path] = source
+            if kept:
+                kept_archives[zip_path] = kept
+
+        kept_loose = []
+        for source, full_destination in loose_files:
+            try:
+                same = (os.path.isfile(full_destination) and owned((None, full_destination), owners[(full_destination, None)])
+                        and same_contents(source, full_destination, reader))
+            except (OSError, KeyError):
+                same = False
+            if same:
+                unchanged += 1
+            else:
+                kept_loose.append((source, full_destination))
+        return kept_archives, kept_loose, unchanged
+
+    def is_installed(self, mod_folder):
+        layers = replay_journal(read_journal(self.get_backup_folder()))
+        return any(layer["mod"] == mod_folder for stack in layers.values() for layer in stack)
+
+    @traced_operation("uninstall")
+    def uninstall_mod(self, mod_folder):
+        """Put back everything the mod replaced, one rewrite per affected archive.
+
+        Returns the number of files restored or removed.
+        """
+        backup_root = self.get_backup_folder()
+        check_no_pending_transactions(backup_root)
+        layers = replay_journal(read_journal(backup_root))
+
+        # Files the mod is on top of go back to what was there before it
+        restorations = plan_uninstall(layers, mod_folder)
+        restores = {}
+        for (archive, entry), original in restorations.items():
+            if archive is None:
+                if original:
+                    atomic_copy(blob_path(backup_root, original["hash"]), entry)
+                    os.utime(entry, ns=(original["mtime_ns"], original["mtime_ns"]))
+                elif os.path.exists(entry):
+                    os.remove(entry)
+            else:
+                restores.setdefault(archive, {})[entry] = original
+
+        jobs = self.plan_archive_jobs({}, restores)
+        wal_dir = begin_transaction(backup_root, "uninstall", mod_folder, jobs)
+        errors = []
+        for zip_path, _, error in self.rewrite_archives(jobs, lambda fraction_sum: self.progress(fraction_sum / max(len(jobs), 1) * 100),
+                                                        backup_root=backup_root, wal_dir=wal_dir):
+            if error is not None:
+                errors.append(f"{zip_path}: {error}")
+        if errors:
+            # Left in place so the uninstall is finished on next launch
+            raise RuntimeError("; ".join(errors))
+        append_journal(backup_root, [{"op": "uninstall", "mod": mod_folder, "time": datetime.now().isoformat(timespec="seconds"),
+                                      "txn": os.path.basename(wal_dir)}])
+        finish_transaction(wal_dir)
+        return len(restorations)
+
+    @traced_operation("backup")
+    def create_backup(self):
+        """Snapshot the Scenes folder into the backup store. See create_snapshot."""
+        last_percent = [-1]
+
+        def report(transfer):
+            # Report whole-percent changes only, not every chunk
+            percent = int(transfer.fraction * 100)
+            if percent != last_percent[0]:
+                last_percent[0] = percent
+                self.progress(percent)
+                self.status(f"Backing up: {transfer.describe()}")
+
+        return create_snapshot(self.get_game_folder(), self.get_backup_folder(), progress=report)
+
+    @traced_operation("restore")
+    def restore_backup(self, manifest_path, changes=None, dry_run=False):
+        """Restore the files that differ from a snapshot. See restore_snapshot."""
+        return restore_snapshot(load_snapshot(manifest_path), self.get_game_folder(), self.get_backup_folder(),
+                                changes=changes, dry_run=dry_run, progress=lambda fraction: self.progress(fraction * 100))
+
+    @traced_operation("recover")
+    def recover_transactions(self, rollback=True):
+        """Recover every interrupted transaction; returns their outcomes."""
+        backup_root = self.get_backup_folder()
+        return [recover_transaction(wal_dir, backup_root, rollback=rollback) for wal_dir in pending_transactions(backup_root)]
+
+    @traced_operation("compact")
+    def compact_archives(self, threshold=0.0):
+        """Compact every scene archive whose dead space is over threshold (by default any).
+
+        Returns (archives_compacted, bytes_reclaimed). Refuses to run while a transaction
+        is pending: recovering an append truncates its archive, which compaction rewrites.
+        """
+        check_no_pending_transactions(self.get_backup_folder())
+        index = self.get_archive_index()
+        index.refresh(self.get_game_folder())
+        zip_paths = sorted(index.archives)
+        compacted = reclaimed = 0
+        for i, zip_path in enumerate(zip_paths):
+            dead, total = archive_dead_space(zip_path)
+            if dead and dead / total > threshold:
+                self.status(f"Compacting {zip_path}...")
+                reclaimed += compact_archive(zip_path)
+                compacted += 1
+            self.progress((i + 1) / len(zip_paths) * 100)
+        self.save_archive_index()
+        return compacted, reclaimed
+
+    def plan_archive_jobs(self, archives, restores=None, owners=None, beneath=None, stored=None):
+        """Combine replacements and restores per archive into the jobs rewrite_archives runs.
+
+        owners maps (zip_path, internal_path) to the mod installing that entry, and
+        beneath and stored to the layers under it (see install_plan). They are kept in
+        each job so recover_transaction can journal a batch install like install_plan.
+        """
+        restores = restores or {}
+        owners = owners or {}
+        beneath = beneath or {}
+        stored = stored or {}
+
+        def per_entry(zip_path, values):
+            return {internal_path: values[(zip_path, internal_path)]
+                    for internal_path in archives.get(zip_path, {}) if (zip_path, internal_path) in values}
+
+        return {zip_path: {"replacements": archives.get(zip_path, {}), "restore": restores.get(zip_path),
+                           "compression": self.get_compression_policy(zip_path),
+                           "append": self.get_append_updates(), "compact_threshold": self.get_compact_threshold(),
+                           "owners": per_entry(zip_path, owners),
+                           "beneath": per_entry(zip_path, {key: beneath[key] for key in stored}),
+                           "stored": per_entry(zip_path, stored)}
+                for zip_path in list(archives) + list(restores)}
+
+    def rewrite_archives(self, jobs, progress, backup_root=None, wal_dir=None):
+        """Rewrite independent scene archives in a process pool.
+
+        jobs comes from plan_archive_jobs. Yields (zip_path, originals, error) as each
+        archive finishes, with error None on success.
+        progress is called with the summed completion fraction of all archives.
+        """
+        fractions = dict.fromkeys(jobs, 0.0)
+        workers = self.get_install_workers(len(jobs))
+
+        def job_options(job):
+            return {"backup_root": backup_root, "restore": job["restore"], "compression": job["compression"], "wal_dir": wal_dir,
+                    "append": job.get("append", False), "compact_threshold": job.get("compact_threshold", COMPACT_THRESHOLD)}
+
+        if workers <= 1:
+            # Not worth spawning processes for a single archive
+            for zip_path, job in jobs.items():
+                self.status(f"Updating zip file: {zip_path} ({len(job['replacements']) + len(job['restore'] or {})} files)")
+
+                def report(fraction, zip_path=zip_path):
+                    # Only redraw on whole-percent changes, like the pool workers
+                    if int(fraction * 100) != int(fractions[zip_path] * 100):
+                        fractions[zip_path] = fraction
+                        progress(sum(fractions.values()))
+
+                try:
+                    originals = update_archive(zip_path, job["replacements"], progress=report, **job_options(job))
+                    yield zip_path, originals, None
+                except Exception as e:
+                    logger.debug("Error updating zip file %s", zip_path, exc_info=True)
+                    yield zip_path, None, e
+                report(1.0)
+            return
+
+        self.status(f"Updating {len(jobs)} zip files with {workers} workers...")
+        progress_queue = multiprocessing.Queue()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_archive_worker, initargs=(progress_queue,)) as pool:
+            futures = {pool.submit(_rewrite_archive_worker, zip_path, job["replacements"], job_options(job), tracer.enabled): zip_path
+                       for zip_path, job in jobs.items()}
+            pending = set(futures)
+            while pending:
+                # Merge progress from every worker into the single progress bar
+                try:
+                    zip_path, fraction = progress_queue.get(timeout=0.1)
+                    fractions[zip_path] = max(fractions[zip_path], fraction)
+                    while True:
+                        zip_path, fraction = progress_queue.get_nowait()
+                        fractions[zip_path] = max(fractions[zip_path], fraction)
+                except queue.Empty:
+                    pass
+                progress(sum(fractions.values()))
+
+                for future in [f for f in pending if f.done()]:
+                    pending.discard(future)
+                    zip_path = futures[future]
+                    fractions[zip_path] = 1.0
+                    error = future.exception()
+                    if error is not None:
+                        logger.debug("Error updating zip file %s", zip_path, exc_info=error)
+                        yield zip_path, None, error
+                    else:
+                        originals, trace_events = future.result()
+                        tracer.merge(trace_events)
+                        yield zip_path, originals, None
+        progress(sum(fractions.values()))
+
+    def finish_trace(self, name, events):
+        """Keep the per-span breakdown of a traced operation and report its slowest spans."""
+        summary = trace_summary(events)
+        self.traces.append({"operation": name, "spans": summary})
+        self.status(f"Trace of {name}: " + ", ".join(f"{span} {entry['seconds']:.3f}s ({entry['count']}x)"
+                                                     for span, entry in list(summary.items())[:6]))
+        if self.chrome_trace_dir:
+            path = os.path.join(self.chrome_trace_dir, f"{name}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.json")
+            try:
+                write_chrome_trace(path, events)
+            except OSError as e:
+                self.log_error(f"Could not write trace {path}: {e}")
+
+
+def run_cli(argv):
+    """Headless entry point: the same engine as the GUI, without creating a Tk root.
+
+    Returns the process exit code. With --json, results and per-phase timings are
+    printed as a JSON document instead of plain text.
+    """
+    def global_options(argument_default=None):
+        options = argparse.ArgumentParser(add_help=False, argument_default=argument_default)
+        options.add_argument("--game-dir", help="game installation folder (default: game_install_folder from config.ini)")
+        options.add_argument("--mods-dir", help="mod library folder")
+        options.add_argument("--backup-dir", help="backup folder (default: backup_folder from config.ini)")
+        options.add_argument("--config", help="config.ini to read settings from")
+        options.add_argument("--workers", type=int, help="archive rewrite processes, 0 for one per CPU core")
+        options.add_argument("--append", action="store_true", help="update archives in append mode instead of rewriting them")
+        options.add_argument("--json", action="store_true", help="print results and timings as JSON")
+        options.add_argument("--trace", action="store_true", help="record span timings and include the breakdown in the output")
+        options.add_argument("--chrome-trace", metavar="DIR", help="also save each operation's spans as a Chrome trace-event file in DIR")
+        options.add_argument("--log-level", help="log file level, e.g. DEBUG (default: level under [Logging] in config.ini, else INFO)")
+        return options
+
+    parser = argparse.ArgumentParser(prog="hbmmodman.py", description="Hitman: Blood Money Mod Manager (headless mode)",
+                                     parents=[global_options()])
+    parser.set_defaults(mods_dir=MODS_PATH, config=CONFIG_PATH)
+    # Global options also work after the subcommand. There they default to SUPPRESS,
+    # so a subcommand doesn't overwrite a value given before it
+    options = global_options(argparse.SUPPRESS)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", parents=[options], help="list the mods in the library")
+    install_parser = commands.add_parser("install", parents=[options], help="install mods")
+    install_parser.add_argument("--mods", required=True, help="comma-separated mod folder names or mod names, in priority order (later mods win conflicts)")
+    install_parser.add_argument("--allow-executables", action="store_true", help="install executable files without asking")
+    uninstall_parser = commands.add_parser("uninstall", parents=[options], help="uninstall mods")
+    uninstall_parser.add_argument("--mods", required=True, help="comma-separated mod folder names or mod names")
+    commands.add_parser("backup", parents=[options], help="create an incremental backup of the Scenes folder")
+    restore_parser = commands.add_parser("restore", parents=[options], help="restore the files that differ from a backup")
+    restore_parser.add_argument("--snapshot", help="snapshot manifest to restore (default: the latest)")
+    restore_parser.add_argument("--dry-run", action="store_true", help="only list what would change")
+    recover_parser = commands.add_parser("recover", parents=[options], help="recover interrupted installs and uninstalls")
+    recover_parser.add_argument("--finish", action="store_true", help="finish interrupted installs instead of rolling them back")
+    commands.add_parser("index", parents=[options], help="update the index of the scene archives' contents")
+    compact_parser = commands.add_parser("compact", parents=[options], help="reclaim the dead space left in archives by append mode")
+    compact_parser.add_argument("--threshold", type=float, default=0.0, help="only compact archives with more than this fraction of dead space")
+    args = parser.parse_args(argv)
+
+    config = configparser.ConfigParser()
+    config.read(args.config)
+    if "Settings" not in config:
+        config["Settings"] = {}
+    if args.game_dir:
+        config["Settings"]["game_install_folder"] = args.game_dir
+    if args.backup_dir:
+        config["Settings"]["backup_folder"] = args.backup_dir
+    if args.workers is not None:
+        config["Settings"]["install_workers"] = str(args.workers)
+    if args.append:
+        if "Archives" not in config:
+            config["Archives"] = {}
+        config["Archives"]["append_updates"] = "true"
+    if args.trace or args.chrome_trace:
+        if "Tracing" not in config:
+            config["Tracing"] = {}
+        config["Tracing"]["enabled"] = "true"
+        if args.chrome_trace:
+            config["Tracing"]["chrome_trace_dir"] = args.chrome_trace
+
+    if args.log_level:
+        if "Logging" not in config:
+            config["Logging"] = {}
+        config["Logging"]["level"] = args.log_level
+    setup_logging(config, console=True)
+
+    errors = []
+
+    def log_error(message):
+        logger.error(message)
+        errors.append(message)
+
+    engine = ModEngine(config, mods_path=args.mods_dir,
+                       status=None if args.json else print,
+                       log_error=log_error,
+                       confirm_executable=lambda source: getattr(args, "allow_executables", False))
+    output = {"command": args.command, "ok": True, "timings": {}, "results": {}}
+
+    def timed(phase, func, *func_args, **func_kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*func_args, **func_kwargs)
+        finally:
+            output["timings"][phase] = round(time.perf_counter() - started, 6)
+
+    def select_mods(mods, names):
+        selected = []
+        for name in (n.strip() for n in names.split(",") if n.strip()):
+            mod = next((m for m in mods if name in (m["folder"], m["name"])), None)
+            if mod is None:
+                raise ValueError(f"Mod '{name}' not found in {args.mods_dir}")
+            selected.append(mod)
+        return selected
+
+    try:
+        if args.command in ("install", "uninstall", "compact") and pending_transactions(engine.get_backup_folder()):
+            # Recovering after this run would roll back over it, so do it now, the same way recover does
+            logger.warning("Rolling back interrupted operations before the %s", args.command)
+            output["results"]["recovered"] = timed("recover", engine.recover_transactions)
+        if args.command in ("list", "install", "uninstall"):
+            mods = timed("load_mods", engine.load_mods)
+        if args.command == "list":
+            output["results"]["mods"] = [{"folder": m["folder"], "name": m["name"], "author": m["author"], "files": len(m["files"])} for m in mods]
+        elif args.command == "install":
+            selected = select_mods(mods, args.mods)
+            # One merged plan, so every scene archive is rewritten once for all the mods
+            installed = timed("install", engine.install_mods, selected)
+            for mod in selected:
+                mod_path = os.path.join(engine.mods_path, mod["folder"]) + os.sep
+                files = [destination for source, destination in installed if source.startswith(mod_path)]
+                output["results"][mod["folder"]] = {"installed": len(files), "files": files}
+        elif args.command == "uninstall":
+            for mod in select_mods(mods, args.mods):
+                if not engine.is_installed(mod["folder"]):
+                    raise ValueError(f"There is no install record for '{mod['folder']}'")
+                restored = timed(f"uninstall:{mod['folder']}", engine.uninstall_mod, mod["folder"])
+                output["results"][mod["folder"]] = {"restored": restored}
+        elif args.command == "backup":
+            manifest_path, manifest = timed("backup", engine.create_backup)
+            output["results"] = {"snapshot": manifest_path, "files": len(manifest["files"]),
+                                 "hashed_files": manifest["hashed_files"], "stored_bytes": manifest["stored_bytes"]}
+        elif args.command == "restore":
+            snapshots = list_snapshots(engine.get_backup_folder())
+            snapshot = args.snapshot or (snapshots[-1] if snapshots else None)
+            if not snapshot:
+                raise ValueError("No backup snapshots found")
+            changes = timed("restore", engine.restore_backup, snapshot, dry_run=args.dry_run)
+            output["results"] = {"snapshot": snapshot, "dry_run": args.dry_run,
+                                 "changes": [{"path": rel_path, "reason": reason} for rel_path, reason in changes]}
+        elif args.command == "recover":
+            output["results"]["recovered"] = timed("recover", engine.recover_transactions, rollback=not args.finish)
+        elif args.command == "index":
+            output["results"]["archives"] = timed("index", engine.refresh_archive_index)
+        elif args.command == "compact":
+            compacted, reclaimed = timed("compact", engine.compact_archives, args.threshold)
+            output["results"].update(compacted=compacted, reclaimed_bytes=reclaimed)
+    except Exception as e:
+        output["ok"] = False
+        logger.debug("%s failed", args.command, exc_info=True)
+        log_error(str(e))
+
+    if engine.traces:
+        output["trace"] = engine.traces
+    output["errors"] = errors
+    output["ok"] = output["ok"] and not errors
+    if args.json:
+        print(json.dumps(output, indent=2))
+    else:
+        for phase, seconds in output["timings"].items():
+            print(f"{phase}: {seconds:.3f}s")
+    return 0 if output["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_cli(sys.argv[1:]))
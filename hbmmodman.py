@@ -1,5 +1,5 @@
 import os
-import traceback
+import sys
 import subprocess
 import threading
 import configparser
@@ -10,14 +10,291 @@ from PIL import Image, ImageTk
 import send2trash
 import zipfile
 import shutil
-import tempfile
-from datetime import datetime
+import queue
+import hashlib
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from hbmmodcore import (MODS_PATH, CONFIG_PATH, SNAPSHOTS_DIR, ModEngine, ModFolderWatcher, ConflictIndex,
+                        pending_transactions, read_transaction, recover_transaction, list_snapshots, route_file, run_cli, tracer,
+                        logger, setup_logging, SourceReader, split_source)
 
-MODS_PATH = "Mods"
 MOD_ICON = "mod.png"
-CONFIG_PATH = "config.ini"
-BACKUP_PATH = "Backups"
 COLUMNS = ("Name", "Description", "Author", "Files")  # Use constants for column names
+EVENT_POLL_MS = 50  # How often the GUI drains engine events, i.e. at most 20 redraws a second
+THUMBNAIL_SIZE = (200, 200)  # Sidebar preview size
+THUMBNAIL_CACHE_DIR = "thumbnails"  # Pre-resized previews, next to config.ini
+THUMBNAIL_CACHE_ENTRIES = 64  # Decoded previews kept in memory
+THUMBNAIL_DISK_ENTRIES = 512  # Pre-resized previews kept on disk
+THUMBNAIL_WORKERS = 2  # Threads decoding and resizing previews; PIL releases the GIL while it works
+THUMBNAIL_PREFETCH_ROWS = 2  # Rows above and below the selection whose previews are decoded ahead
+FILE_SUMMARY_COUNT = 3  # Mod files named in the Files column before it says "+N more"
+
+
+@functools.lru_cache(maxsize=256)
+def archive_names(zip_path, mtime_ns, size):
+    """Entry names of a mod archive, cached per version of the file."""
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        return frozenset(zf.namelist())
+
+
+def thumbnail_key(image_path):
+    """(absolute path, mtime_ns, size) of an image, or None if there is no such file.
+
+    An image inside a mod archive goes by the archive's mtime and size.
+    """
+    zip_path, internal_path = split_source(image_path)
+    try:
+        stat = os.stat(zip_path)
+        if internal_path is not None and internal_path not in archive_names(zip_path, stat.st_mtime_ns, stat.st_size):
+            return None
+    except (OSError, zipfile.BadZipFile):
+        return None
+    return (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+
+
+def load_thumbnail(key, cache_dir=THUMBNAIL_CACHE_DIR, size=THUMBNAIL_SIZE):
+    """Decode an image resized for the sidebar, from the on-disk cache when it is there.
+
+    Returns a PIL image. Misses are resized once and saved to cache_dir, which is
+    trimmed to THUMBNAIL_DISK_ENTRIES files.
+    """
+    path, mtime_ns, file_size = key
+    name = hashlib.sha1(f"{path}|{mtime_ns}|{file_size}|{size[0]}x{size[1]}".encode("utf-8")).hexdigest()
+    cached_path = os.path.join(cache_dir, name + ".png")
+    try:
+        with Image.open(cached_path) as image:
+            image.load()
+            return image
+    except OSError:
+        pass
+
+    with SourceReader() as reader, reader.open(path) as f, Image.open(f) as image:
+        thumbnail = image.resize(size, Image.LANCZOS)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_path = cached_path + ".tmp"
+        thumbnail.save(temp_path, "PNG")
+        os.replace(temp_path, cached_path)
+        cached = [entry for entry in os.scandir(cache_dir) if entry.name.endswith(".png")]
+        if len(cached) > THUMBNAIL_DISK_ENTRIES:
+            cached.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in cached[:len(cached) - THUMBNAIL_DISK_ENTRIES]:
+                os.remove(entry.path)
+    except OSError as e:
+        logger.warning("Could not cache thumbnail of %s: %s", path, e)
+    return thumbnail
+
+
+class ThumbnailCache:
+    """Most recently used sidebar previews as ready-to-show PhotoImages.
+
+    Keyed by thumbnail_key, so an edited mod.png is decoded again. At most
+    max_entries images are kept; the least recently shown is dropped first.
+    Decoding and resizing run in a thread pool. Only the PhotoImage is created on
+    the Tk thread, in a function handed to post(func, *args), which must run it there.
+    Everything else is called from the Tk thread.
+    """
+
+    def __init__(self, post, max_entries=THUMBNAIL_CACHE_ENTRIES, cache_dir=THUMBNAIL_CACHE_DIR):
+        self.post = post
+        self.max_entries = max(1, max_entries)
+        self.cache_dir = cache_dir
+        self.entries = OrderedDict()
+        self.waiting = {}  # thumbnail_key -> callbacks for decodes in flight
+        self.pool = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+
+    def request(self, image_path, callback=None):
+        """Call callback(photo) with image_path's PhotoImage, or with None if it has none.
+
+        Cached images are handed over straight away; anything else is decoded in the
+        pool first. Without a callback this only prefetches.
+        """
+        key = thumbnail_key(image_path)
+        if key is None:
+            if callback:
+                callback(None)
+            return
+        photo = self.entries.get(key)
+        if photo is not None:
+            self.entries.move_to_end(key)
+            if callback:
+                callback(photo)
+            return
+        if key in self.waiting:
+            if callback:
+                self.waiting[key].append(callback)
+            return
+        self.waiting[key] = [callback] if callback else []
+        self.pool.submit(self._decode, key)
+
+    def _decode(self, key):
+        try:
+            image, error = load_thumbnail(key, self.cache_dir), None
+        except Exception as e:  # Corrupt images raise more than OSError, and the callbacks must still run
+            image, error = None, e
+        self.post(self._decoded, key, image, error)
+
+    def _decoded(self, key, image, error):
+        photo = None
+        if error is not None:
+            logger.warning("Error loading mod image %s: %s", key[0], error)
+        else:
+            photo = ImageTk.PhotoImage(image)
+            self.entries[key] = photo
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        for callback in self.waiting.pop(key, ()):
+            callback(photo)
+
+
+class VirtualTable:
+    """A ttk.Treeview that only holds the rows currently on screen.
+
+    The full, ordered list of row keys lives in self.keys and row_values(key) builds
+    a row when it scrolls into view, so thousands of rows cost a list of keys rather
+    than thousands of Treeview items. Keys double as the iids of the visible rows.
+    Selection is tracked by key and survives scrolling.
+    """
+
+    def __init__(self, parent, columns, row_values):
+        self.row_values = row_values
+        self.keys = []
+        self.positions = {}
+        self.selected = set()
+        self.offset = 0
+        self.visible_rows = 20
+
+        self.frame = ttk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, columns=columns, show="headings", selectmode="extended")
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
+
+        self.tree.bind("<Configure>", self._on_resize)
+        self.tree.bind("<Button-1>", self._on_click)
+        self.tree.bind("<<TreeviewSelect>>", self._on_select)
+        self.tree.bind("<MouseWheel>", lambda event: self.scroll(-event.delta // 120 if abs(event.delta) >= 120 else -event.delta))
+        self.tree.bind("<Button-4>", lambda event: self.scroll(-3))
+        self.tree.bind("<Button-5>", lambda event: self.scroll(3))
+        self.tree.bind("<Up>", lambda event: self.move_selection(-1))
+        self.tree.bind("<Down>", lambda event: self.move_selection(1))
+        self.tree.bind("<Prior>", lambda event: self.move_selection(-self.visible_rows))
+        self.tree.bind("<Next>", lambda event: self.move_selection(self.visible_rows))
+        self.tree.bind("<Home>", lambda event: self.move_selection(-len(self.keys)))
+        self.tree.bind("<End>", lambda event: self.move_selection(len(self.keys)))
+
+    def pack(self, **options):
+        self.frame.pack(**options)
+
+    def bind(self, sequence, func):
+        # Added alongside the table's own handlers instead of replacing them
+        return self.tree.bind(sequence, func, add="+")
+
+    def heading(self, column, **options):
+        return self.tree.heading(column, **options)
+
+    def column(self, column, **options):
+        return self.tree.column(column, **options)
+
+    def winfo_exists(self):
+        return self.tree.winfo_exists()
+
+    def set_rows(self, keys):
+        """Replace every row, keeping the selection of keys that are still there."""
+        self.keys = list(keys)
+        self.positions = {key: index for index, key in enumerate(self.keys)}
+        self.selected &= self.positions.keys()
+        self.render()
+
+    def update_rows(self, removed, updated):
+        """Drop removed keys, append new ones and redraw; existing rows keep their place."""
+        if removed:
+            self.keys = [key for key in self.keys if key not in removed]
+        self.keys.extend(key for key in updated if key not in self.positions)
+        self.set_rows(self.keys)
+
+    def sort(self, key, reverse=False):
+        """Reorder the rows by key(row_key)."""
+        self.set_rows(sorted(self.keys, key=key, reverse=reverse))
+
+    def selection(self):
+        """Selected keys in row order, including rows scrolled out of view."""
+        return sorted(self.selected, key=self.positions.__getitem__)
+
+    def neighbours(self, key, count):
+        """Up to count keys on each side of key, nearest first."""
+        index = self.positions.get(key)
+        if index is None:
+            return []
+        around = []
+        for distance in range(1, count + 1):
+            around.extend(self.keys[i] for i in (index + distance, index - distance) if 0 <= i < len(self.keys))
+        return around
+
+    def render(self):
+        """Rebuild the visible rows with one delete and one insert per row on screen."""
+        self.offset = max(0, min(self.offset, len(self.keys) - self.visible_rows))
+        window = self.keys[self.offset:self.offset + self.visible_rows + 1]
+        self.tree.delete(*self.tree.get_children())
+        for key in window:
+            self.tree.insert("", "end", iid=key, values=self.row_values(key))
+        self.tree.selection_set([key for key in window if key in self.selected])
+        if self.keys:
+            self.scrollbar.set(self.offset / len(self.keys), min(1.0, (self.offset + self.visible_rows) / len(self.keys)))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def yview(self, *args):
+        """Scrollbar command: ("moveto", fraction) or ("scroll", count, "units" or "pages")."""
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * len(self.keys))
+            self.render()
+        elif args[0] == "scroll":
+            self.scroll(int(args[1]) * (self.visible_rows if args[2] == "pages" else 1))
+
+    def scroll(self, rows):
+        self.offset += rows
+        self.render()
+        return "break"
+
+    def see(self, key):
+        index = self.positions[key]
+        if index < self.offset:
+            self.offset = index
+        elif index >= self.offset + self.visible_rows:
+            self.offset = index - self.visible_rows + 1
+        self.render()
+
+    def move_selection(self, step):
+        """Keyboard navigation over every row, not just the ones on screen."""
+        if not self.keys:
+            return "break"
+        current = self.tree.focus() or next(iter(self.selection()), None)
+        # Without a current row, start from the edge of what is on screen
+        index = self.positions.get(current, self.offset - 1 if step > 0 else self.offset + self.visible_rows)
+        key = self.keys[max(0, min(len(self.keys) - 1, index + step))]
+        self.selected = {key}
+        self.see(key)
+        self.tree.focus(key)
+        return "break"
+
+    def _on_resize(self, event):
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        visible_rows = max(1, (event.height - row_height) // row_height)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.render()
+
+    def _on_click(self, event):
+        # A plain click replaces the selection, including rows scrolled out of view
+        if not event.state & 0x0005:  # Shift or Control
+            self.selected.clear()
+
+    def _on_select(self, event):
+        on_screen = set(self.tree.get_children())
+        self.selected = (self.selected - on_screen) | set(self.tree.selection())
+
 
 class ModManagerApp(tk.Tk):
     def __init__(self):
@@ -37,11 +314,26 @@ class ModManagerApp(tk.Tk):
         # Load or create config file for game installation folder
         self.config = configparser.ConfigParser()
         self.load_or_create_config()
+        setup_logging(self.config)
+        self.thumbnails = ThumbnailCache(lambda func, *args: self.events.put(("call", func, args, None)),
+                                         self.config.getint("Thumbnails", "cache_entries", fallback=THUMBNAIL_CACHE_ENTRIES),
+                                         self.config.get("Thumbnails", "cache_dir", fallback=THUMBNAIL_CACHE_DIR) or THUMBNAIL_CACHE_DIR)
+        # The engine runs on worker threads and reports through this queue; only drain_events touches Tk
+        self.events = queue.Queue()
+        self.busy = False
+        self.engine = ModEngine(self.config, events=self.events, confirm_executable=self.confirm_executable)
     
         self.create_widgets()
         self.create_progress_bar()
+        self.recover_interrupted_transactions()
         self.mods = self.load_mods()  # Load mods after widgets are created
 
+        # Keep the library current without rescans; deltas are applied on the Tk thread
+        self.mod_watcher = ModFolderWatcher(MODS_PATH, self.parse_mod_info,
+                                            lambda removed, updated: self.events.put(("call", self.apply_mod_changes, (removed, updated), None)))
+        self.mod_watcher.start()
+        self.after(EVENT_POLL_MS, self.drain_events)
+
     def create_style(self):
         self.style = ttk.Style(self)
         self.style.theme_use('clam')
@@ -60,6 +352,7 @@ class ModManagerApp(tk.Tk):
         menu_bar.add_cascade(label="File", menu=file_menu)
         file_menu.add_command(label="Change Game Directory", command=self.change_game_directory)
         file_menu.add_command(label="Change Backup Folder", command=self.change_backup_folder)
+        file_menu.add_command(label="Compact Scene Archives", command=self.compact_archives)
 
         view_menu = tk.Menu(menu_bar, tearoff=0)
         menu_bar.add_cascade(label="View", menu=view_menu)
@@ -120,14 +413,14 @@ class ModManagerApp(tk.Tk):
         self.load_mod_image("mod.png")
 
     def load_mod_image(self, image_path):
-        try:
-            image = Image.open(image_path)
-            image = image.resize((200, 200), Image.ANTIALIAS)
-            photo = ImageTk.PhotoImage(image)
-            self.mod_image_label.config(image=photo)
-            self.mod_image_label.image = photo
-        except:
-            self.mod_image_label.config(text="No Image Available")
+        def show(photo):
+            if photo:
+                self.mod_image_label.config(image=photo)
+                self.mod_image_label.image = photo
+            else:
+                self.mod_image_label.config(text="No Image Available")
+
+        self.thumbnails.request(image_path, show)
 
     def update_theme(self):
         if self.is_dark_theme:
@@ -164,90 +457,222 @@ class ModManagerApp(tk.Tk):
 
     def show_progress(self, value):
         self.progress_var.set(value)
-        self.progress_bar.pack(fill=tk.X, padx=10, pady=5)
-        self.update_idletasks()
+        if not self.progress_bar.winfo_ismapped():
+            self.progress_bar.pack(fill=tk.X, padx=10, pady=5)
 
     def hide_progress(self):
         self.progress_bar.pack_forget()
-        self.update_idletasks()
 
-    def backup_files(self):
-        """Creates a backup of the game's Scene folder."""
-        if messagebox.askyesno("Backup", "Do you want to create a backup of the Scene folder?"):
-            game_folder = self.config.get("Settings", "game_install_folder", fallback="")
-            if not game_folder or not os.path.isdir(game_folder):
-                error_msg = "Invalid game folder path. Please configure the correct path."
-                self.handle_error(error_msg)
+    def drain_events(self):
+        """Apply queued engine events on the Tk thread, then check again after EVENT_POLL_MS.
+
+        Status and progress events are coalesced so each frame redraws them at most once.
+        """
+        pending = {}
+
+        def flush():
+            if not pending:
                 return
-    
-            backup_name = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-            backup_path = os.path.join(BACKUP_PATH, backup_name)
-    
+            with tracer.span("ui_update"):
+                if "progress" in pending:
+                    self.show_progress(pending.pop("progress"))
+                if "status" in pending:
+                    self.update_status(pending.pop("status"))
+
         try:
-            with zipfile.ZipFile(backup_path, "w", zipfile.ZIP_DEFLATED) as backup_zip:
-                scenes_folder = os.path.join(game_folder, "Scenes")
-                if not os.path.exists(scenes_folder):
-                    raise FileNotFoundError(f"Scenes folder not found at {scenes_folder}")
-
-                total_files = sum([len(files) for r, d, files in os.walk(scenes_folder)])
-                files_processed = 0
-                
-                for root, _, files in os.walk(scenes_folder):
-                    for file in files:
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, game_folder)
-                        backup_zip.write(file_path, arcname)
-                        
-                        files_processed += 1
-                        self.show_progress(files_processed / total_files * 100)
-        
-            self.hide_progress()
-            self.update_status(f"Backup created successfully: {backup_name}")
-            messagebox.showinfo("Backup Complete", f"Backup created successfully: {backup_name}")
-        except Exception as e:
-            self.handle_error(f"An error occurred while creating the backup: {e}")
+            while True:
+                event = self.events.get_nowait()
+                kind = event[0]
+                if kind in ("status", "progress"):
+                    pending[kind] = event[1]
+                elif kind == "error":
+                    self.log_error(event[1])
+                elif kind == "call":
+                    # Apply everything queued before the call so it sees (and can override) the latest state
+                    flush()
+                    _, func, args, reply = event
+                    result = None
+                    try:
+                        result = func(*args)
+                    except Exception:
+                        logger.exception("Error in Tk callback %s", getattr(func, "__name__", func))
+                    finally:
+                        if reply is not None:
+                            reply.put(result)
+        except queue.Empty:
+            pass
+        flush()
+        self.after(EVENT_POLL_MS, self.drain_events)
+
+    def call_on_main(self, func, *args):
+        """Run func on the Tk thread from a worker thread and return its result."""
+        reply = queue.Queue(maxsize=1)
+        self.events.put(("call", func, args, reply))
+        return reply.get()
+
+    def run_in_background(self, work, on_done, error_prefix):
+        """Run work() on a worker thread so the window keeps responding.
+
+        on_done(result) runs on the Tk thread when it finishes; an exception is reported
+        as "<error_prefix>: <error>". Only one operation runs at a time.
+        """
+        if self.busy:
+            messagebox.showinfo("Busy", "Another operation is still running. Please wait for it to finish.")
+            return
+        self.busy = True
+        self.show_progress(0)
+
+        def worker():
+            try:
+                result = work()
+            except Exception as e:
+                logger.debug("Background operation failed", exc_info=True)
+                self.events.put(("call", self._finish_background, (None, None, f"{error_prefix}: {e}"), None))
+            else:
+                self.events.put(("call", self._finish_background, (on_done, result, None), None))
+
+        threading.Thread(target=worker).start()
+
+    def _finish_background(self, on_done, result, error_msg):
+        self.busy = False
+        self.hide_progress()
+        if error_msg is not None:
+            self.handle_error(error_msg)
+        else:
+            on_done(result)
+
+    def backup_files(self):
+        """Creates an incremental backup of the game's Scene folder."""
+        if not messagebox.askyesno("Backup", "Do you want to create a backup of the Scene folder?"):
+            return
+        game_folder = self.config.get("Settings", "game_install_folder", fallback="")
+        if not game_folder or not os.path.isdir(game_folder):
+            error_msg = "Invalid game folder path. Please configure the correct path."
+            self.handle_error(error_msg)
+            return
+
+        def backup_done(result):
+            manifest_path, manifest = result
+            backup_name = os.path.splitext(os.path.basename(manifest_path))[0]
+            summary = f"{len(manifest['files'])} files, {manifest['hashed_files']} changed, {manifest['stored_bytes'] / (1024 * 1024):.1f} MB new data"
+            self.update_status(f"Backup created successfully: {backup_name} ({summary})")
+            messagebox.showinfo("Backup Complete", f"Backup created successfully: {backup_name}\n\n{summary}")
+
+        self.run_in_background(self.engine.create_backup, backup_done, "An error occurred while creating the backup")
+
+    def recover_interrupted_transactions(self):
+        """Repair only the archives an interrupted install or uninstall was rewriting.
+
+        Only an install can go either way, so only installs ask; the archive rewrites
+        run in the background.
+        """
+        backup_root = self.get_backup_folder()
+        recoveries = []
+        for wal_dir in pending_transactions(backup_root):
+            rollback = True
+            try:
+                begin = read_transaction(wal_dir)
+            except (OSError, ValueError):
+                begin = None  # recover_transaction reports it
+            if begin is not None and begin.get("kind") == "install":
+                rollback = messagebox.askyesno(
+                    "Interrupted Install",
+                    f"Installing '{begin.get('mod')}' did not finish. Only the scene archives it was working on are affected.\n\n"
+                    "Yes: roll the install back.\nNo: finish it instead.")
+            recoveries.append((wal_dir, rollback))
+        if not recoveries:
+            return
+
+        def work():
+            outcomes = []
+            for wal_dir, rollback in recoveries:
+                try:
+                    outcomes.append((recover_transaction(wal_dir, backup_root, rollback=rollback), None))
+                except Exception as e:
+                    logger.debug("Recovering %s failed", wal_dir, exc_info=True)
+                    outcomes.append((None, f"Failed to recover interrupted operation in {wal_dir}: {e}"))
+            return outcomes
+
+        def recovered(outcomes):
+            for outcome, error_msg in outcomes:
+                if error_msg is not None:
+                    self.handle_error(error_msg)
+                else:
+                    self.update_status(f"Recovered interrupted operation: {outcome}")
+
+        self.run_in_background(work, recovered, "Failed to recover interrupted operations")
+
+    def get_backup_folder(self):
+        return self.engine.get_backup_folder()
 
     def handle_error(self, error_msg):
         """Handle errors by logging, showing a message box, and updating the status bar."""
-        with open("mod_manager_log.log", "a") as log_file:
-            log_file.write(f"{datetime.now()}: {error_msg}\n")
+        logger.error(error_msg)
         messagebox.showerror("Error", error_msg)
         self.update_status(f"Error: {error_msg}")
 
-    def update_status(self, message):
-        logging.info(message)
-        self.status_var.set(message)
-        self.update_idletasks()
-    
     def restore_backup(self):
-        """Restore the backup to the game's Scene folder."""
+        """Restore the files that differ from a backup to the game's Scene folder."""
+        backup_root = self.get_backup_folder()
         backup_file = filedialog.askopenfilename(
-            initialdir=BACKUP_PATH,
+            initialdir=os.path.join(backup_root, SNAPSHOTS_DIR),
             title="Select Backup to Restore",
-            filetypes=[("ZIP files", "*.zip")]
+            filetypes=[("Backup snapshots", "*.json"), ("ZIP files", "*.zip")]
         )
         
         if not backup_file:
             self.update_status("No backup selected for restoration.")
             return
     
-        if not messagebox.askyesno("Restore Backup", "Are you sure you want to restore the backup? This will overwrite existing Scene files."):
-            self.update_status("Backup restoration canceled by user.")
-            return
-    
         game_folder = self.config.get("Settings", "game_install_folder", fallback="")
         if not game_folder or not os.path.isdir(game_folder):
             self.handle_error("Invalid game folder path. Please configure the correct path.")
             return
-    
-        try:
-            scene_folder = os.path.join(game_folder, "Scenes")
+
+        if not backup_file.lower().endswith(".json"):
+            self.restore_zip_backup(backup_file, game_folder)
+            return
+
+        self.update_status("Comparing backup with game files...")
+        self.run_in_background(lambda: self.engine.restore_backup(backup_file, dry_run=True),
+                               lambda changes: self.confirm_restore(backup_file, changes), "Failed to read backup")
+
+    def confirm_restore(self, backup_file, changes):
+        if not changes:
+            self.update_status("Game files already match the backup.")
+            messagebox.showinfo("Restore Backup", "Game files already match the backup. Nothing to restore.")
+            return
+
+        # Dry run first, so the user sees exactly what will be overwritten
+        preview = "\n".join(f"{rel_path} ({reason})" for rel_path, reason in changes[:20])
+        if len(changes) > 20:
+            preview += f"\n...and {len(changes) - 20} more"
+        if not messagebox.askyesno("Restore Backup", f"{len(changes)} files differ from the backup and will be restored:\n\n{preview}\n\nContinue?"):
+            self.update_status("Backup restoration canceled by user.")
+            return
+
+        def restore_done(_):
+            self.update_status(f"Backup restored successfully ({len(changes)} files).")
+            messagebox.showinfo("Restore Complete", f"Backup restored successfully. {len(changes)} files were restored.")
+
+        self.run_in_background(lambda: self.engine.restore_backup(backup_file, changes=changes), restore_done, "Failed to restore backup")
+
+    def restore_zip_backup(self, backup_file, game_folder):
+        """Restore an older full-zip backup. Its arcnames are relative to the game folder."""
+        if not messagebox.askyesno("Restore Backup", "Are you sure you want to restore the backup? This will overwrite existing Scene files."):
+            self.update_status("Backup restoration canceled by user.")
+            return
+
+        def extract():
             with zipfile.ZipFile(backup_file, "r") as backup_zip:
-                backup_zip.extractall(scene_folder)
+                backup_zip.extractall(game_folder)
+
+        def restore_done(_):
             self.update_status("Backup restored successfully.")
             messagebox.showinfo("Restore Complete", "Backup restored successfully.")
-        except Exception as e:
-            self.handle_error(f"Failed to restore backup: {e}")
+
+        self.update_status("Restoring backup...")
+        self.run_in_background(extract, restore_done, "Failed to restore backup")
 
     def load_or_create_config(self):
         """Load or prompt for the game install directory if it doesn't exist in config."""
@@ -260,8 +685,25 @@ class ModManagerApp(tk.Tk):
             if "Settings" not in self.config:
                 self.config["Settings"] = {
                     "game_install_folder": "",
-                    "backup_folder": "Backups"
+                    "backup_folder": "Backups",
+                    "install_workers": "0"
                 }
+            if "Compression" not in self.config:
+                # auto, deflate or store; add a line per archive (e.g. m05_main.zip = store) to override
+                self.config["Compression"] = {"default": "auto"}
+            if "Tracing" not in self.config:
+                # Span timings of installs, backups and restores; chrome_trace_dir saves them for chrome://tracing
+                self.config["Tracing"] = {"enabled": "false", "chrome_trace_dir": ""}
+            if "Logging" not in self.config:
+                # DEBUG, INFO, WARNING or ERROR; the file is rotated at max_bytes
+                self.config["Logging"] = {"level": "INFO", "file": "mod_manager_log.txt", "max_bytes": "1048576", "backup_count": "3"}
+            if "Archives" not in self.config:
+                # append_updates adds changed files to the end of an archive instead of rewriting it,
+                # compacting it once compact_threshold of it is dead space
+                self.config["Archives"] = {"append_updates": "false", "compact_threshold": "0.25"}
+            if "Thumbnails" not in self.config:
+                # Mod previews kept decoded in memory, plus pre-resized copies in cache_dir
+                self.config["Thumbnails"] = {"cache_entries": str(THUMBNAIL_CACHE_ENTRIES), "cache_dir": THUMBNAIL_CACHE_DIR}
             self.save_config()
 
     def prompt_for_game_folder(self):
@@ -288,60 +730,75 @@ class ModManagerApp(tk.Tk):
             self.save_config()
             self.update_status(f"Backup folder changed to: {directory}")
 
+    def compact_archives(self):
+        """Reclaim the space left behind in the scene archives by append mode."""
+        def compact_done(result):
+            compacted, reclaimed = result
+            self.update_status(f"Compacted {compacted} archives, reclaimed {reclaimed / (1024 * 1024):.1f} MB.")
+
+        self.run_in_background(self.engine.compact_archives, compact_done, "Failed to compact archives")
+
     def save_config(self):
         with open(CONFIG_PATH, 'w') as configfile:
             self.config.write(configfile)
 
     def load_mods(self):
-        self.mods = []
-        for mod_folder in os.listdir(MODS_PATH):
-            mod_path = os.path.join(MODS_PATH, mod_folder)
-            if os.path.isdir(mod_path):
-                mod_info = self.parse_mod_info(mod_path)
-                if mod_info:
-                    self.mods.append(mod_info)
+        self.mods = self.engine.load_mods()
+        self.mods_by_folder = {mod["folder"]: mod for mod in self.mods}
+        self.conflict_index = ConflictIndex(self.mods)
         self.populate_mod_tree()
+        return self.mods
 
     def parse_mod_info(self, mod_path):
-        mod_txt_path = os.path.join(mod_path, "mod.txt")
-        if os.path.exists(mod_txt_path):
-            with open(mod_txt_path, 'r') as f:
-                lines = f.readlines()
-            
-            mod_info = {
-                "name": "",
-                "author": "",
-                "description": "",
-                "files": [],
-                "folder": os.path.basename(mod_path)
-            }
-
-            for line in lines:
-                if line.startswith("Name:"):
-                    mod_info["name"] = line.split(":", 1)[1].strip()
-                elif line.startswith("Author:"):
-                    mod_info["author"] = line.split(":", 1)[1].strip()
-                elif line.startswith("Description:"):
-                    mod_info["description"] = line.split(":", 1)[1].strip()
-                elif ":" in line and not line.startswith("#"):
-                    destination, source = map(str.strip, line.split(":", 1))
-                    mod_info["files"].append({"source": source, "destination": destination})
-
-            return mod_info
-        return None
+        return self.engine.parse_mod_info(mod_path)
 
     def populate_mod_tree(self):
         self.mod_tree.delete(*self.mod_tree.get_children())
         for mod in self.mods:
-            self.mod_tree.insert("", "end", text=mod["name"], values=(mod["author"],))
+            self.mod_tree.insert("", "end", iid=mod["folder"], text=mod["name"], values=(mod["author"],))
+
+    def apply_mod_changes(self, removed, updated):
+        """Apply watcher deltas, touching only the affected mod_tree and mods_table rows."""
+        gone = set(removed) | {folder for folder, mod in updated.items() if mod is None}
+        fresh = {folder: mod for folder, mod in updated.items() if mod}
+        changed_count = len(fresh)
+        mods = []
+        for mod in self.mods:
+            if mod["folder"] not in gone:
+                mods.append(fresh.pop(mod["folder"], mod))
+        mods.extend(fresh.values())
+        self.mods = mods
+        for folder in gone:
+            self.conflict_index.remove_mod(folder)
+        for mod in updated.values():
+            if mod:
+                self.conflict_index.add_mod(mod)
+
+        self.mods_by_folder = {mod["folder"]: mod for mod in self.mods}
+
+        for folder in gone:
+            if self.mod_tree.exists(folder):
+                self.mod_tree.delete(folder)
+        for folder, mod in updated.items():
+            if mod:
+                self._upsert_row(self.mod_tree, folder, text=mod["name"], values=(mod["author"],))
+        if hasattr(self, "mods_table") and self.mods_table.winfo_exists():
+            self.mods_table.update_rows(gone, [folder for folder, mod in updated.items() if mod])
+        self.update_status(f"Mod library updated: {changed_count} changed, {len(gone)} removed")
+
+    def _upsert_row(self, table, iid, **options):
+        if table.exists(iid):
+            table.item(iid, **options)
+        else:
+            table.insert("", "end", iid=iid, **options)
 
     def parse_mod_txt(self, mod_txt_path):
-        print(f"Parsing mod.txt: {mod_txt_path}")
+        logger.debug("Parsing mod.txt: %s", mod_txt_path)
         mod_info = {"name": "", "description": "", "author": "", "files": []}
         try:
             with open(mod_txt_path, "r", encoding="utf-8") as f:
                 content = f.read()
-            print(f"Raw content of mod.txt:\n{content}")
+            logger.debug("Raw content of mod.txt:\n%s", content)
             
             lines = content.split("\n")
             for line in lines:
@@ -352,15 +809,14 @@ class ModManagerApp(tk.Tk):
                     key, value = [part.strip() for part in line.split(":", 1)]
                     if key.lower() in ["name", "description", "author"]:
                         mod_info[key.lower()] = value
-                        print(f"Parsed {key}: {value}")
+                        logger.debug("Parsed %s: %s", key, value)
                     else:  # This is a file mapping
                         mod_info["files"].append({"destination": key, "source": value})
-                        print(f"Parsed file: {value} -> {key}")
+                        logger.debug("Parsed file: %s -> %s", value, key)
             
-            print(f"Parsed mod info: {mod_info}")
-        except Exception as e:
-            print(f"Error parsing mod.txt: {str(e)}")
-            traceback.print_exc()
+            logger.debug("Parsed mod info: %s", mod_info)
+        except Exception:
+            logger.exception("Error parsing mod.txt %s", mod_txt_path)
         
         return mod_info
     def create_widgets(self):
@@ -394,15 +850,16 @@ class ModManagerApp(tk.Tk):
         right_frame = tk.Frame(self.mod_window)
         right_frame.pack(side="right", fill="both", expand=True)
     
-        # Treeview for mod list
-        self.mods_table = ttk.Treeview(right_frame, columns=COLUMNS, show="headings", selectmode="extended")
+        # Mod list; only the rows on screen exist as Treeview items
+        self.mods_table = VirtualTable(right_frame, COLUMNS, lambda folder: self.mod_row_values(self.mods_by_folder[folder]))
         for col in COLUMNS:
             self.mods_table.heading(col, text=col, command=lambda _col=col: self.sort_table(_col))
             self.mods_table.column(col, width=150)
         self.mods_table.pack(fill="both", expand=True, padx=10, pady=10)
     
-        # Display mod image on row selection
+        # Display mod image on row selection, full details on double-click
         self.mods_table.bind("<<TreeviewSelect>>", self.display_selected_mod_image)
+        self.mods_table.bind("<Double-1>", lambda event: self.show_mod_details())
     
         # Action buttons
         button_frame = tk.Frame(right_frame)
@@ -419,6 +876,9 @@ class ModManagerApp(tk.Tk):
      
         delete_button = tk.Button(button_frame, text="Delete Selected Mod", command=self.delete_mod)
         delete_button.pack(side="left", padx=5)
+
+        conflicts_button = tk.Button(button_frame, text="Show Conflicts", command=self.show_conflict_matrix)
+        conflicts_button.pack(side="left", padx=5)
     
         # Populate the table after it's created
         self.populate_mods_table()
@@ -426,173 +886,129 @@ class ModManagerApp(tk.Tk):
     def display_selected_mod_image(self, event):
         selected_item = self.mods_table.selection()
         if selected_item:
-            mod_name = self.mods_table.item(selected_item[0])["values"][0]
-            for mod in self.mods:
-                if mod["name"] == mod_name:
-                    mod_path = mod["path"]
-                    mod_image_path = os.path.join(mod_path, MOD_ICON)
-                    if os.path.exists(mod_image_path):
-                        self.update_sidebar_image(mod_image_path)
-                    else:
-                        self.mod_image_label.config(image="", text="No Image Found")  # Show placeholder text
-                    break
+            # mods_table rows are keyed by mod folder, so no need to search self.mods
+            self.update_sidebar_image(self.engine.mod_file(self.mods_by_folder[selected_item[0]], MOD_ICON))
+            self.prefetch_thumbnails(selected_item[0])
 
     def update_sidebar_image(self, image_path):
-        img = Image.open(image_path).resize((200, 200))
-        self.mod_image = ImageTk.PhotoImage(img)
-        self.mod_image_label.config(image=self.mod_image, text="")
+        self.sidebar_image_path = image_path
+
+        def show(photo):
+            if image_path != self.sidebar_image_path:
+                return  # The selection moved on while this one was decoding
+            if photo:
+                self.mod_image = photo
+                self.mod_image_label.config(image=self.mod_image, text="")
+            else:
+                self.mod_image_label.config(image="", text="No Image Found")  # Show placeholder text
+
+        self.thumbnails.request(image_path, show)
+
+    def prefetch_thumbnails(self, item):
+        """Start decoding the previews of the rows around item, so arrowing onto them is instant."""
+        for row in self.mods_table.neighbours(item, THUMBNAIL_PREFETCH_ROWS):
+            self.thumbnails.request(self.engine.mod_file(self.mods_by_folder[row], MOD_ICON))
+
+    def show_mod_details(self):
+        """Show the full description and file list of the selected mod, which the table truncates."""
+        selected_items = self.mods_table.selection()
+        if not selected_items:
+            return
+        mod = self.mods_by_folder[selected_items[0]]
+        dialog = tk.Toplevel(self.mod_window)
+        dialog.title(mod["name"])
+        details_text = tk.Text(dialog, wrap="word", height=20, width=80)
+        details_text.pack(fill="both", expand=True, padx=10, pady=10)
+        details_text.insert("end", f"Author: {mod['author']}\n\n{mod['description']}\n\nFiles ({len(mod['files'])}):\n")
+        details_text.insert("end", "Checking the game's scene archives...\n", "existing")
+        details_text.insert("end", "\n".join(f"{file['source']} -> {file['destination']}" for file in mod["files"]))
+        details_text.config(state="disabled")
+        tk.Button(dialog, text="Close", command=dialog.destroy).pack(pady=5)
+
+        def show_existing(line):
+            if not details_text.winfo_exists():
+                return  # Closed before the lookup finished
+            start, end = details_text.tag_ranges("existing")
+            details_text.config(state="normal")
+            details_text.delete(start, end)
+            details_text.insert(start, line)
+            details_text.config(state="disabled")
+
+        def count_existing():
+            # A stale archive index re-reads scene archives and saves itself, so not on the Tk thread
+            try:
+                line = f"Replaces {len(self.engine.existing_entries(mod))} files in the game's scene archives.\n"
+            except ValueError:
+                line = ""  # No valid game folder configured
+            except Exception:
+                logger.debug("Could not look up the files %s replaces", mod["folder"], exc_info=True)
+                line = ""
+            self.events.put(("call", show_existing, (line,), None))
+
+        threading.Thread(target=count_existing, daemon=True).start()
 
     def sort_table(self, col):
         """Sort the mod table by a selected column, toggling ascending/descending order."""
         try:
             self.sort_asc = not getattr(self, 'sort_asc', True)
-            mods = [(self.mods_table.set(k, col), k) for k in self.mods_table.get_children("")]
-            mods.sort(reverse=not self.sort_asc)
-            for index, (val, k) in enumerate(mods):
-                self.mods_table.move(k, "", index)
+            column = COLUMNS.index(col)
+            self.mods_table.sort(lambda folder: str(self.mod_row_values(self.mods_by_folder[folder])[column]).lower(),
+                                 reverse=not self.sort_asc)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to sort table:\n{e}")
 
-    def install_mod_file(self, source, destination, mod_folder):    											   
-        print(f"Installing mod file: {source}")
-        try:
-            # Update status for the current file
-            self.update_status(f"Installing {os.path.basename(source)}...")
-    
-            # Check for executable files and warn the user
-            if source.lower().endswith((".exe", ".dll", ".bat", ".cmd", ".sh", ".scr", ".lnk", ".pif", ".cpl", ".sys", ".vbs", ".jar", ".asi")):
-                proceed = messagebox.askyesno("Caution: Potential Malicious File",f"{os.path.basename(source)} is an executable file. \nThis could contain potentially malicious code. Make absolutely certain you trust this file, you can use virus scanners like VirusTotal before you use it.\n\nAre you sure you want to install it?")
-                if not proceed:
-                    self.update_status(f"Skipped {os.path.basename(source)}")
-                    return  # Skip the installation for this file
-    
-            game_folder = self.config.get("Settings", "game_install_folder", fallback="")    																     																			    			    																			   
-            if not game_folder or not os.path.isdir(game_folder):
-                raise ValueError(f"Invalid game folder path: {game_folder}")
-            
-            # Use the new mapping function to determine the correct destination
-            mapped_destination = self.get_file_destination(os.path.basename(source), mod_folder)
-            full_destination = os.path.join(game_folder, mapped_destination if mapped_destination else "")    			    															
-            
-            print(f"Mapped destination: {full_destination}")
-            
-            # Check if the destination is inside a zip file
-            if ".zip" in full_destination:
-                # Handle files intended to go within .zip archives
-                zip_path, internal_path = full_destination.split(".zip", 1)
-                zip_path += ".zip"
-                internal_path = internal_path.lstrip("/")
-                self.update_status(f"Updating zip file: {zip_path} at {internal_path}")
-                print(f"Updating zip file: {zip_path} at {internal_path}")    														
-														
-    
-                if not os.path.exists(zip_path): # Logic to updating .zip files contents
-                    print(f"Warning: Zip file does not exist: {zip_path}")
-                    os.makedirs(os.path.dirname(zip_path), exist_ok=True)
-                    with zipfile.ZipFile(zip_path, "w") as zf:
-                        pass  # Create an empty zip file
-                
-                # Create a temporary directory to work with the zip file
-                with tempfile.TemporaryDirectory() as tmpdirname:
-                    # Extract the zip file
-                    with zipfile.ZipFile(zip_path, "r") as zip_ref:
-                        zip_ref.extractall(tmpdirname)
-                    
-                    # Copy the new file to the correct location
-                    temp_dest = os.path.join(tmpdirname, internal_path)
-                    os.makedirs(os.path.dirname(temp_dest), exist_ok=True)
-                    shutil.copy2(source, temp_dest)
-                    
-                    # Create a new zip file with the updated contents
-                    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zip_ref:
-                        for root, _, files in os.walk(tmpdirname):
-                            for file in files:
-                                file_path = os.path.join(root, file)
-                                arc_name = os.path.relpath(file_path, tmpdirname)
-                                zip_ref.write(file_path, arc_name)
-                
-                print(f"Updated zip file: {zip_path}")
-                self.update_status(f"Updated zip file: {zip_path}")
-            else:
-                # Place file in regular directory, for files not in zip archives, just copy them directly
-                os.makedirs(os.path.dirname(full_destination), exist_ok=True)
-                shutil.copy2(source, full_destination)
-                print(f"Copied file to: {full_destination}")
-                self.update_status(f"Copied file to: {full_destination}")
-	
-            print(f"Successfully installed: {source} to {full_destination}")
-    
-        except Exception as e:
-            print(f"Error installing file: {source}")
-            print(f"Error details: {str(e)}")
-            traceback.print_exc()
-            error_msg = f"Error installing {source}: {e}"
-            self.update_status(f"Last error: {error_msg}")
-            self.log_error(error_msg)
-    
+    def install_mod_file(self, source, destination, mod_folder):
+        """Install a single mod file. Prefer install_mod_files for anything larger."""
+        return self.install_mod_files([source], mod_folder)
+
+    def install_mod_files(self, sources, mod_folder):
+        """Install mod files, rewriting each target scene archive exactly once."""
+        return self.engine.install_mod_files(sources, mod_folder)
+
+    def confirm_executable(self, source):
+        # Asked from the engine's worker thread, so the dialog is shown on the Tk thread
+        return self.call_on_main(messagebox.askyesno, "Caution: Potential Malicious File",f"{os.path.basename(source)} is an executable file. \nThis could contain potentially malicious code. Make absolutely certain you trust this file, you can use virus scanners like VirusTotal before you use it.\n\nAre you sure you want to install it?")
+
     def update_status(self, message):
-        """Update the status bar message."""
+        """Update the status bar message. Tk thread only; the engine posts status events instead."""
+        logger.debug("Status: %s", message)
         self.status_var.set(message)
-        self.root.update_idletasks()  # Refresh the GUI immediately
     
     def log_error(self, message):
-        """Log error messages to a file."""
-        with open("mod_manager_log.txt", "a") as log_file:
-            log_file.write(message + "\n")
+        """Log an error reported by the engine."""
+        logger.error(message)
 
     def install_selected_mods(self):
-        # Check if the install button exists and disable it during installation
-        if hasattr(self, 'install_button'):
-            self.install_button.config(state="disabled")
-    
-        # Start installation in a background thread
-        threading.Thread(target=self._install_selected_mods_thread).start()
-    
-    def _install_selected_mods_thread(self):
-        try:
-            self._install_selected_mods_process()
-        finally:
-            # Re-enable the install button once installation is complete
-            if hasattr(self, 'install_button'):
-                self.install_button.config(state="normal")
-    
-    def _install_selected_mods_process(self):
-        selected_items = self.mod_tree.selection()
+        # Rows of both trees are keyed by mod folder; the table's order is the install priority
+        if hasattr(self, "mods_table") and self.mods_table.winfo_exists() and self.mods_table.selection():
+            selected_items = self.mods_table.selection()
+        else:
+            selected_items = self.mod_tree.selection()
         if not selected_items:
             messagebox.showinfo("No Selection", "Please select a mod to install.")
             return
 
-        mod_name = self.mod_tree.item(selected_items[0], "text")
-        mod = next((m for m in self.mods if m["name"] == mod_name), None)
-
-        if not mod:
-            self.handle_error(f"Mod '{mod_name}' not found.")
+        mods = [self.mods_by_folder[folder] for folder in selected_items if folder in self.mods_by_folder]
+        if not mods:
+            self.handle_error("The selected mods were not found.")
             return
+        mod_name = mods[0]["name"] if len(mods) == 1 else f"{len(mods)} mods"
 
         game_folder = self.config.get("Settings", "game_install_folder", fallback="")
         if not game_folder or not os.path.isdir(game_folder):
             self.handle_error("Invalid game folder path. Please configure the correct path.")
             return
 
-        try:
-            self.show_progress(0)
-            total_files = len(mod["files"])
-            for i, file_info in enumerate(mod["files"]):
-                source = os.path.join(MODS_PATH, mod["folder"], file_info["source"])
-                destination = os.path.join(game_folder, file_info["destination"])
-                
-                os.makedirs(os.path.dirname(destination), exist_ok=True)
-                shutil.copy2(source, destination)
-                
-                self.show_progress((i + 1) / total_files * 100)
-
-            self.hide_progress()
+        keep_first = not self.detect_conflicts([mod["folder"] for mod in mods])
+
+        def install_done(installed_files):
             self.update_status(f"Mod '{mod_name}' installed successfully.")
             messagebox.showinfo("Installation Complete", f"Mod '{mod_name}' has been installed.")
-        except Exception as e:
-            self.handle_error(f"Error installing mod '{mod_name}': {str(e)}")
-    
-        self.show_installation_summary(installed_files)
+            self.show_installation_summary(installed_files)
+
+        # Installing runs on a worker thread; the engine reports back through self.events.
+        # The whole selection is one plan, so each scene archive is rewritten only once.
+        self.run_in_background(lambda: self.engine.install_mods(mods, keep_first), install_done, f"Error installing mod '{mod_name}'")
 
     def uninstall_selected_mod(self):
         selected_items = self.mod_tree.selection()
@@ -612,58 +1028,61 @@ class ModManagerApp(tk.Tk):
             self.handle_error("Invalid game folder path. Please configure the correct path.")
             return
 
+        if not self.engine.is_installed(mod["folder"]):
+            messagebox.showinfo("Not Installed", f"There is no install record for '{mod_name}'.")
+            return
+
         if messagebox.askyesno("Confirm Uninstallation", f"Are you sure you want to uninstall '{mod_name}'?"):
-            try:
-                self.show_progress(0)
-                total_files = len(mod["files"])
-                for i, file_info in enumerate(mod["files"]):
-                    file_path = os.path.join(game_folder, file_info["destination"])
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                    
-                    self.show_progress((i + 1) / total_files * 100)
-
-                self.hide_progress()
+            def uninstall_done(_):
                 self.update_status(f"Mod '{mod_name}' uninstalled successfully.")
                 messagebox.showinfo("Uninstallation Complete", f"Mod '{mod_name}' has been uninstalled.")
-            except Exception as e:
-                self.handle_error(f"Error uninstalling mod '{mod_name}': {str(e)}")
+
+            self.run_in_background(lambda: self.engine.uninstall_mod(mod["folder"]), uninstall_done, f"Error uninstalling mod '{mod_name}'")
 
     # Detect and handle file conflicts among selected mods.
-    def detect_conflicts(self, selected_mods):
-        file_destinations = {}
-        conflicts = []
-    
-        # Collect all files and their destinations for selected mods
-        for mod in selected_mods:
-            mod_info = next((m for m in self.mods if m["name"] == mod), None)
-            if mod_info:
-                for file_info in mod_info["files"]:
-                    destination = self.get_file_destination(file_info["source"], mod_info["folder_name"])
-    
-                    # Check if another mod has the same destination
-                    if destination in file_destinations:
-                        conflicts.append((destination, file_destinations[destination], file_info["source"]))
-                    else:
-                        file_destinations[destination] = file_info["source"]
-    
+    def detect_conflicts(self, folders):
+        """Check the selected mod folders against the conflict index.
+
+        Returns True to let later selections overwrite earlier ones, False to keep the
+        file from the first mod that writes it.
+        """
+        conflicts = self.conflict_index.conflicts(folders)
+        if not conflicts:
+            return True
+
         # Prompt user to resolve conflicts
-        if conflicts:
-            conflict_message = "Conflicting files detected:\n"
-            for dest, existing, new in conflicts:
-                conflict_message += f"\nFile '{new}' conflicts with '{existing}' at '{dest}'"
-    
-            # Let the user decide which version to keep
-            if messagebox.askyesno("Conflict Detected", f"{conflict_message}\n\nProceed by keeping the new versions?"):
-                # If yes, overwrite with the new files (default behavior)
-                self.status_var.set("Resolved conflicts by keeping new files.")
-            else:
-                # If no, skip installing conflicting files
-                self.status_var.set("Resolved conflicts by keeping existing files.")
-                for dest, existing, new in conflicts:
-                    del file_destinations[dest]  # Remove conflicts to avoid overwriting
-    
-        return file_destinations  # Return the final set of files to install
+        conflict_message = "Conflicting files detected:\n"
+        for (archive, entry), writers in list(conflicts.items())[:20]:
+            conflict_message += f"\n'{entry}' in '{archive or 'game folder'}' is written by {', '.join(writers)}"
+        if len(conflicts) > 20:
+            conflict_message += f"\n...and {len(conflicts) - 20} more"
+
+        # Let the user decide which version to keep
+        if messagebox.askyesno("Conflict Detected", f"{conflict_message}\n\nProceed by keeping the new versions?"):
+            # If yes, overwrite with the new files (default behavior)
+            self.status_var.set("Resolved conflicts by keeping new files.")
+            return True
+        # If no, keep the file from the first mod that writes it
+        self.status_var.set("Resolved conflicts by keeping existing files.")
+        return False
+
+    def show_conflict_matrix(self):
+        """List every pair of mods in the library that write the same files."""
+        mods_by_folder = {m["folder"]: m["name"] for m in self.mods}
+        matrix = self.conflict_index.conflict_matrix()
+        lines = []
+        for folder in sorted(matrix):
+            for other, count in sorted(matrix[folder].items()):
+                if folder < other:
+                    lines.append(f"{mods_by_folder.get(folder, folder)} <-> {mods_by_folder.get(other, other)}: {count} files")
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Mod Conflicts")
+        conflicts_text = tk.Text(dialog, wrap="none", height=20, width=80)
+        conflicts_text.pack(fill="both", expand=True, padx=10, pady=10)
+        conflicts_text.insert("end", "\n".join(lines) if lines else "No conflicts between mods in the library.")
+        conflicts_text.config(state="disabled")
+        tk.Button(dialog, text="Close", command=dialog.destroy).pack(pady=5)
 
     # Show installed files after installation completion in a little dropdown text window after clicking the arrow in the pop-up box
     def show_installation_summary(self, installed_files):
@@ -717,7 +1136,8 @@ class ModManagerApp(tk.Tk):
         messagebox.showinfo("Install", "Successfully installed selected mods.")
 
     def check_backup(self):
-        return os.path.exists(BACKUP_PATH) and any(os.scandir(BACKUP_PATH))
+        backup_root = self.get_backup_folder()
+        return bool(list_snapshots(backup_root)) or (os.path.isdir(backup_root) and any(name.endswith(".zip") for name in os.listdir(backup_root)))
 
     def add_mod(self):
         mod_file = filedialog.askopenfilename(
@@ -727,82 +1147,81 @@ class ModManagerApp(tk.Tk):
         
         if mod_file:
             try:
-                with zipfile.ZipFile(mod_file, "r") as zip_ref:
-                    zip_ref.extractall(MODS_PATH)
-                messagebox.showinfo("Success", "Mod extracted successfully!")
+                # Mods are read straight from their .zip, so importing is just putting it in the Mods folder
+                if self.parse_mod_info(mod_file) is None:
+                    messagebox.showerror("Error", "This archive has no mod.txt, it is not a mod.")
+                    return
+                target = os.path.join(MODS_PATH, os.path.basename(mod_file))
+                if os.path.exists(target) and not messagebox.askyesno("Replace Mod", f"'{os.path.basename(mod_file)}' is already in the Mods folder. Replace it?"):
+                    return
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to add mod:\n{e}")
+                return
+
+            def work():
+                # Copying a large mod from another drive takes a while, so keep it off the Tk thread
+                os.makedirs(MODS_PATH, exist_ok=True)
+                temp_path = target + ".tmp"
+                try:
+                    os.link(mod_file, temp_path)  # Instant on the same drive
+                except OSError:
+                    shutil.copy2(mod_file, temp_path)
+                os.replace(temp_path, target)
+
+            def on_done(_):
+                messagebox.showinfo("Success", "Mod added successfully!")
                 self.mods = self.load_mods()  # Reload mods
                 self.populate_mods_table()    # Refresh table
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to extract mod:\n{e}")
+
+            self.run_in_background(work, on_done, "Failed to add mod")
 
     def populate_mods(self):
-        print("Populating mod list...")
+        logger.debug("Populating mod list...")
         self.mod_table.delete(*self.mod_table.get_children())
         for mod in self.mods:
-            print(f"Adding mod to list: {mod['name']}")
+            logger.debug("Adding mod to list: %s", mod["name"])
             file_paths = ", ".join([f"{file['source']} -> {file['destination']}" for file in mod.get("files", [])])
             self.mod_table.insert("", "end", values=(mod["name"], mod.get("description", ""), mod.get("author", ""), file_paths))
-        print(f"Mod list populated with {len(self.mods)} mods")
+        logger.debug("Mod list populated with %d mods", len(self.mods))
         
         # Update the mod image if available
         if self.mods:
             self.update_mod_image(self.mods[0])
 
     def update_mod_image(self, mod):
-        print(f"Updating mod image for: {mod['name']}")
-        if "image_path" in mod and os.path.exists(mod["image_path"]):
-            try:
-                image = Image.open(mod["image_path"])
-                image = image.resize((200, 200), Image.ANTIALIAS)
-                photo = ImageTk.PhotoImage(image)
-                self.mod_image_label.config(image=photo)
-                self.mod_image_label.image = photo
-                print(f"Mod image updated: {mod['image_path']}")
-            except Exception as e:
-                print(f"Error loading mod image: {str(e)}")
-                self.mod_image_label.config(image=None, text="No Image Available")
-        else:
-            print(f"No image available for mod: {mod['name']}")
-            self.mod_image_label.config(image=None, text="No Image Available")
-    def update_mod_image(self, mod):
-        print(f"Updating mod image for: {mod['name']}")
-        if "image_path" in mod and os.path.exists(mod["image_path"]):
-            try:
-                image = Image.open(mod["image_path"])
-                image = image.resize((200, 200), Image.ANTIALIAS)
-                photo = ImageTk.PhotoImage(image)
+        logger.debug("Updating mod image for: %s", mod["name"])
+
+        def show(photo):
+            if photo:
                 self.mod_image_label.config(image=photo)
                 self.mod_image_label.image = photo
-                print(f"Mod image updated: {mod['image_path']}")
-            except Exception as e:
-                print(f"Error loading mod image: {str(e)}")
+                logger.debug("Mod image updated: %s", mod["image_path"])
+            else:
+                logger.debug("No image available for mod: %s", mod["name"])
                 self.mod_image_label.config(image=None, text="No Image Available")
+
+        if "image_path" in mod:
+            self.thumbnails.request(mod["image_path"], show)
         else:
-            print(f"No image available for mod: {mod['name']}")
-            self.mod_image_label.config(image=None, text="No Image Available")
+            show(None)
+
     def populate_mods_table(self):
-        # Clear the table to create a blanking effect
-        for item in self.mods_table.get_children():
-            self.mods_table.delete(item)
-    
-        # Set a brief delay to simulate the blanking effect before repopulating
-        self.mods_table.after(100, self._populate_mods_table)  # 100 ms delay
-    
-    def _populate_mods_table(self):
-        # Populate the table with mods from the parsed data
-        for mod in self.mods:
-            # Extract file paths for display in the table
-            file_paths = [file["source"] for file in mod["files"]]
-            self.mods_table.insert(
-                "",
-                "end",
-                values=(mod["name"], mod["description"], mod["author"], ", ".join(file_paths))
-            )
+        # One batched refresh; rows are only built for what is on screen
+        self.mods_by_folder = {mod["folder"]: mod for mod in self.mods}
+        self.mods_table.set_rows(self.mods_by_folder)
+
+    def mod_row_values(self, mod):
+        # Name the first few files only; show_mod_details lists them all
+        file_paths = [file["source"] for file in mod["files"][:FILE_SUMMARY_COUNT]]
+        if len(mod["files"]) > FILE_SUMMARY_COUNT:
+            file_paths.append(f"+{len(mod['files']) - FILE_SUMMARY_COUNT} more")
+        return (mod["name"], mod["description"], mod["author"], ", ".join(file_paths))
 
     def check_backup(self):
         """Check if at least one backup exists in the backup directory."""
         # Backup path check with a boolean return value
-        return os.path.exists(BACKUP_PATH) and any(os.scandir(BACKUP_PATH))
+        backup_root = self.get_backup_folder()
+        return bool(list_snapshots(backup_root)) or (os.path.isdir(backup_root) and any(name.endswith(".zip") for name in os.listdir(backup_root)))
 
     def open_config_editor(self):
         """Open a dialog to edit game installation folder path."""
@@ -816,63 +1235,23 @@ class ModManagerApp(tk.Tk):
             messagebox.showwarning("Warning", "No path selected. Game folder path was not updated.")
 
     def get_file_destination(self, file_name, mod_folder):
-        print(f"Determining destination for file: {file_name}")
-        file_extension = os.path.splitext(file_name)[1].lower()
-    
-        # Special rule for placing config files in the root directory
-        if file_name.lower() == "hitmanbloodmoney.ini" or file_extension in [".ini"]:
-            print(f"{file_name} will be placed in the main game directory.")
-            return file_name
-    
-        # Special case for saveandcontinue.TEX
-        if file_name.lower() == "saveandcontinue.tex":
-            return "Scenes/saveandcontinue.zip/Scenes/saveandcontinue.TEX"
-        
-        # Define mission scene types
-        scene_types = ["_albino", "_intro", "_main", "_news", "_premission", "_postmission"]
-        missions = ["Hideout"] + [f"M{str(i).zfill(2)}" for i in range(14) if i != 7]
-    
-        # Match mission-specific files with scene types
-        for mission in missions:
-            for scene_type in scene_types:
-                if file_name.startswith(mission) and scene_type in file_name:
-                    return f"Scenes/{mission}/{mission}{scene_type}.zip/Scenes/{mission}/{file_name}"
-    
-        # Handle general file types that go into mission folders
-        general_types = [".anm", ".buf", ".gms", ".loc", ".mat", ".oct", ".prm", ".prp", ".rmc", ".rmi", ".sgd", ".sgp", ".snd", ".sup", ".tex", ".zgf"]
-        if file_extension in general_types:
-            # Assume it goes into the main mission folder matching the mod folder name
-            for mission in missions:
-                if mission.lower() in mod_folder.lower():
-                    return f"Scenes/{mission}/{mission}_main.zip/Scenes/{mission}/{file_name}"
-    
-        # Special cases for HitmanBloodMoney.zip and saveandcontinue.zip (single location rules)
-        if "hitmanbloodmoney" in file_name.lower():
-            return f"Scenes/HitmanBloodMoney.zip/Scenes/{file_name}"
-        if "saveandcontinue" in file_name.lower():
-            return f"Scenes/saveandcontinue.zip/Scenes/{file_name}"
-    
-        # Default case: place in the main game directory if no other rule matches
-        print(f"No specific rule for {file_name}, placing in main game directory")
-        return file_name
+        return route_file(file_name, mod_folder)
 
     def delete_mod(self):
         selected_item = self.mods_table.selection()
         if selected_item:
-            mod_name = self.mods_table.item(selected_item[0])["values"][0]
+            mod = self.mods_by_folder[selected_item[0]]
+            mod_name = mod["name"]
             confirm = messagebox.askyesno("Delete Mod", f"Are you sure you want to delete '{mod_name}'?")
             if confirm:
-                for mod in self.mods:
-                    if mod["name"] == mod_name:
-                        mod_path = mod["path"]
-                        try:
-                            send2trash(mod_path)
-                            messagebox.showinfo("Deleted", f"'{mod_name}' has been deleted.")
-                            self.mods.remove(mod)
-                            self.populate_mods_table()
-                        except Exception as e:
-                            messagebox.showerror("Error", f"Failed to delete '{mod_name}': {e}")
-                        break
+                mod_path = os.path.join(MODS_PATH, mod["folder"])
+                try:
+                    send2trash.send2trash(mod_path)
+                    messagebox.showinfo("Deleted", f"'{mod_name}' has been deleted.")
+                    self.mods.remove(mod)
+                    self.populate_mods_table()
+                except Exception as e:
+                    messagebox.showerror("Error", f"Failed to delete '{mod_name}': {e}")
 
     def explore_mod_contents(self):
         selected_items = self.mods_table.selection()
@@ -889,12 +1268,11 @@ class ModManagerApp(tk.Tk):
     
         # Open each selected mod's folder
         for item in selected_items:
-            mod_name = self.mods_table.item(item)["values"][0]
-            mod_info = next((mod for mod in self.mods if mod["name"] == mod_name), None)
+            mod_info = self.mods_by_folder.get(item)
     
             if mod_info:
-                mod_path = os.path.join(MODS_PATH, mod_info["folder_name"])
-                print(f"Opening folder: {mod_path}")
+                mod_path = os.path.join(MODS_PATH, mod_info["folder"])
+                logger.info("Opening folder: %s", mod_path)
     
                 if os.path.exists(mod_path):
                     if os.name == 'nt':  # For Windows
@@ -902,12 +1280,13 @@ class ModManagerApp(tk.Tk):
                     elif os.name == 'posix':  # For macOS/Linux
                         subprocess.Popen(["open" if sys.platform == "darwin" else "xdg-open", mod_path])
                 else:
-                    print(f"Error: Mod folder does not exist at {mod_path}")
+                    logger.error("Mod folder does not exist at %s", mod_path)
                     messagebox.showerror("Error", f"Mod folder not found: {mod_path}")
 
 # Run the application
 if __name__ == "__main__":
-    print("Main block executed.")
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
     root = tk.Tk()
     app = ModManagerApp()
     root.mainloop()
\ No newline at end of file